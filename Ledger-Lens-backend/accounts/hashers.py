@@ -0,0 +1,8 @@
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+
+class PasscodeArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id tuned for the 6-digit passcode check on every login (~50-80ms per verify)"""
+    time_cost = 2
+    memory_cost = 65536
+    parallelism = 2
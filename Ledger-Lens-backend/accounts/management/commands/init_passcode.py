@@ -1,11 +1,10 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings as django_settings
-from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from datetime import timedelta
 import os
-import random
-from accounts.models import PasscodeConfig
+import secrets
+from accounts.models import PasscodeConfig, hash_passcode
 
 
 class Command(BaseCommand):
@@ -25,7 +24,7 @@ class Command(BaseCommand):
             passcode = os.getenv('INITIAL_PASSCODE')
         if not passcode:
             # Generate random 6-digit passcode
-            passcode = str(random.randint(100000, 999999))
+            passcode = str(secrets.randbelow(900000) + 100000)
             self.stdout.write(
                 self.style.WARNING(f'No passcode provided. Generated random passcode: {passcode}')
             )
@@ -38,23 +37,32 @@ class Command(BaseCommand):
             return
         
         expiry_days = getattr(django_settings, 'PASSCODE_EXPIRY_DAYS', 7)
+        # Hash once; reused for both the create and update paths
+        passcode_hash = hash_passcode(passcode)
+        expires_at = timezone.now() + timedelta(days=expiry_days)
         # Create or update config
         config, created = PasscodeConfig.objects.get_or_create(
             pk=1,
             defaults={
-                'passcode_hash': make_password(passcode),
+                'passcode_hash': passcode_hash,
                 'passcode_configured': True,
-                'expires_at': timezone.now() + timedelta(days=expiry_days)
+                'expires_at': expires_at
             }
         )
 
         if not created:
-            # Update existing
-            config.passcode_hash = make_password(passcode)
+            # Update existing (hash, expiry and attempt counters in a single UPDATE)
+            config.passcode_hash = passcode_hash
             config.passcode_configured = True
-            config.expires_at = timezone.now() + timedelta(days=expiry_days)
-            config.reset_attempts()
-            config.save()
+            config.expires_at = expires_at
+            config.passcode_attempts = 0
+            config.creds_attempts = 0
+            config.passcode_locked_until = None
+            config.creds_locked_until = None
+            config.save(update_fields=[
+                'passcode_hash', 'passcode_configured', 'expires_at', 'last_reset_at',
+                'passcode_attempts', 'creds_attempts', 'passcode_locked_until', 'creds_locked_until',
+            ])
             self.stdout.write(
                 self.style.SUCCESS(f'Passcode updated successfully')
             )
@@ -7,9 +7,16 @@ from django.contrib.auth.hashers import check_password
 def backfill_passcode_configured(apps, schema_editor):
     """Existing rows: if current hash is 000000, leave configured=False; else True."""
     PasscodeConfig = apps.get_model('accounts', 'PasscodeConfig')
-    for config in PasscodeConfig.objects.all():
-        config.passcode_configured = not check_password('000000', config.passcode_hash)
-        config.save()
+    configs = []
+    for config in PasscodeConfig.objects.only('pk', 'passcode_hash').iterator(chunk_size=100):
+        # Only hashes from a known hasher can be the 000000 placeholder; skip the KDF for anything else
+        is_placeholder = (
+            config.passcode_hash.startswith(('pbkdf2_', 'argon2'))
+            and check_password('000000', config.passcode_hash)
+        )
+        config.passcode_configured = not is_placeholder
+        configs.append(config)
+    PasscodeConfig.objects.bulk_update(configs, ['passcode_configured'], batch_size=500)
 
 
 def noop_reverse(apps, schema_editor):
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-14 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_pdfupload_processed_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='passcodeconfig',
+            name='passcode_hash',
+            field=models.CharField(max_length=128),
+        ),
+        migrations.AddConstraint(
+            model_name='passcodeconfig',
+            constraint=models.CheckConstraint(condition=models.Q(('id', 1)), name='passcode_singleton'),
+        ),
+    ]
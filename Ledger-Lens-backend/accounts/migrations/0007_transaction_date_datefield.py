@@ -0,0 +1,63 @@
+# Convert Transaction.date from the raw extractor string to a real DateField
+
+import re
+from datetime import date
+
+from django.db import migrations, models
+
+DATE_PARTS_RE = re.compile(r'(\d{1,4})\D+(\d{1,2})\D+(\d{1,4})')
+
+
+def parse_legacy_date(value):
+    """Parse stored values such as '(2024, 6, 17)', '2024/06/17', '17/06/2024' or '2024-06-17'."""
+    match = DATE_PARTS_RE.search(value or '')
+    if not match:
+        return None
+    first, month, last = match.groups()
+    year, day = (first, last) if len(first) == 4 else (last, first)
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def backfill_date_parsed(apps, schema_editor):
+    Transaction = apps.get_model('accounts', 'Transaction')
+    batch = []
+    for txn in Transaction.objects.only('pk', 'date').iterator(chunk_size=2000):
+        txn.date_parsed = parse_legacy_date(txn.date)
+        batch.append(txn)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ['date_parsed'])
+            batch = []
+    if batch:
+        Transaction.objects.bulk_update(batch, ['date_parsed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_alter_passcodeconfig_passcode_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='date_parsed',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_date_parsed, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='date',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='date_parsed',
+            new_name='date',
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['pdf_upload', 'date'], name='transaction_pdf_date_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Move the per-page resume buffer out of the extracted_text_pages JSON column into an NDJSON file
+
+import json
+
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+
+
+def move_text_pages_to_files(apps, schema_editor):
+    PDFUpload = apps.get_model('accounts', 'PDFUpload')
+    in_progress = PDFUpload.objects.filter(processed=False).exclude(extracted_text_pages=[])
+    for pdf_upload in in_progress.only('pk', 'extracted_text_pages').iterator(chunk_size=20):
+        content = ''.join(
+            json.dumps({'page': page_num, 'text': text}, ensure_ascii=False) + '\n'
+            for page_num, text in enumerate(pdf_upload.extracted_text_pages or [])
+        )
+        pdf_upload.page_texts_file.save(f'pdf_{pdf_upload.pk}.ndjson', ContentFile(content.encode('utf-8')), save=False)
+        pdf_upload.save(update_fields=['page_texts_file'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_transaction_date_datefield'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfupload',
+            name='page_texts_file',
+            field=models.FileField(blank=True, null=True, upload_to='page_texts/'),
+        ),
+        migrations.RunPython(move_text_pages_to_files, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='pdfupload',
+            name='extracted_text_pages',
+        ),
+    ]
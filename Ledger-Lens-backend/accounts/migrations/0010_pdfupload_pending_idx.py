@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-14 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_pdfupload_page_texts_file'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pdfupload',
+            index=models.Index(condition=models.Q(('processed', False)), fields=['processed', 'id'], name='pdfupload_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-14 12:30
+
+from django.db import migrations, models
+
+SUMMARY_DEFAULTS = {
+    'customer_name': '',
+    'account_number': '',
+    'iban_number': '',
+    'financial_period': '',
+    'opening_balance': 0,
+    'closing_balance': 0,
+}
+
+
+def copy_account_summary(apps, schema_editor):
+    """Fill the summary columns from account_info of already processed uploads (None stays NULL)."""
+    PDFUpload = apps.get_model('accounts', 'PDFUpload')
+    batch = []
+    for pdf_upload in PDFUpload.objects.filter(processed=True).only('pk', 'account_info').iterator(chunk_size=100):
+        account_info = pdf_upload.account_info or {}
+        for name, default in SUMMARY_DEFAULTS.items():
+            setattr(pdf_upload, name, account_info.get(name, default))
+        batch.append(pdf_upload)
+        if len(batch) >= 100:
+            PDFUpload.objects.bulk_update(batch, list(SUMMARY_DEFAULTS))
+            batch = []
+    if batch:
+        PDFUpload.objects.bulk_update(batch, list(SUMMARY_DEFAULTS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_pdfupload_claimed_by_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfupload',
+            name='customer_name',
+            field=models.TextField(blank=True, default='', null=True),
+        ),
+        migrations.AddField(
+            model_name='pdfupload',
+            name='account_number',
+            field=models.TextField(blank=True, default='', null=True),
+        ),
+        migrations.AddField(
+            model_name='pdfupload',
+            name='iban_number',
+            field=models.TextField(blank=True, default='', null=True),
+        ),
+        migrations.AddField(
+            model_name='pdfupload',
+            name='financial_period',
+            field=models.TextField(blank=True, default='', null=True),
+        ),
+        migrations.AddField(
+            model_name='pdfupload',
+            name='opening_balance',
+            field=models.FloatField(blank=True, default=0, null=True),
+        ),
+        migrations.AddField(
+            model_name='pdfupload',
+            name='closing_balance',
+            field=models.FloatField(blank=True, default=0, null=True),
+        ),
+        migrations.RunPython(copy_account_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-14 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_pdfupload_account_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfupload',
+            name='task_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
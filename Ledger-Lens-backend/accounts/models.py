@@ -1,12 +1,113 @@
-from django.db import models
+from django.db import models, transaction
+from django.core.cache import cache
+from django.core.files.base import ContentFile
 from django.utils import timezone
 from django.conf import settings as django_settings
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import check_password, get_hasher
+from collections import OrderedDict
 from datetime import timedelta
+from functools import lru_cache
+import hashlib
+import hmac
 import json
+import os
+import secrets
+import socket
+import threading
+import time
 
 # Create your models here.
 
+# Cancellation flags for in-flight extractions. The in-process set covers the thread fallback; the cache
+# entry reaches Celery workers in other processes. Checked by the extractor between pages.
+PDF_CANCEL_TTL_SECONDS = 2 * 60 * 60
+_cancelled_pdf_ids = set()
+_cancelled_pdf_lock = threading.Lock()
+
+
+def _pdf_cancel_key(pdf_upload_id):
+    return f'pdf_cancelled_{pdf_upload_id}'
+
+
+def cancel_pdf_processing(*pdf_upload_ids):
+    """Flag uploads so a running extraction stops before its next page"""
+    if not pdf_upload_ids:
+        return
+    with _cancelled_pdf_lock:
+        _cancelled_pdf_ids.update(pdf_upload_ids)
+    cache.set_many({_pdf_cancel_key(pk): True for pk in pdf_upload_ids}, PDF_CANCEL_TTL_SECONDS)
+
+
+def is_pdf_processing_cancelled(pdf_upload_id):
+    with _cancelled_pdf_lock:
+        if pdf_upload_id in _cancelled_pdf_ids:
+            return True
+    return bool(cache.get(_pdf_cancel_key(pdf_upload_id)))
+
+
+def forget_pdf_cancellation(pdf_upload_id):
+    """Drop the local flag once the job has finished (the cache entry expires on its own)"""
+    with _cancelled_pdf_lock:
+        _cancelled_pdf_ids.discard(pdf_upload_id)
+
+
+# Per-page progress for the progress endpoint, kept in the cache so frequent progress polls skip the database
+PDF_PROGRESS_TTL_SECONDS = 60 * 60
+
+
+def _pdf_progress_key(pdf_upload_id):
+    return f'pdf_progress_{pdf_upload_id}'
+
+
+def set_pdf_progress(pdf_upload_id, current_page, total_pages):
+    """Record pages finished so far (1-based count) for a running extraction"""
+    cache.set(_pdf_progress_key(pdf_upload_id), (current_page, total_pages), PDF_PROGRESS_TTL_SECONDS)
+
+
+def cached_pdf_progress(pdf_upload_id):
+    """(current_page, total_pages) of a running extraction, or None if none has been recorded"""
+    return cache.get(_pdf_progress_key(pdf_upload_id))
+
+
+def clear_pdf_progress(pdf_upload_id):
+    cache.delete(_pdf_progress_key(pdf_upload_id))
+
+
+# Extracted-text cache entry (BankStatementExtractor.text_cache_key) each upload wrote or read, so deleting or
+# stopping the upload also evicts its statement text
+def _pdf_text_key(pdf_upload_id):
+    return f'pdf_text_key_{pdf_upload_id}'
+
+
+def remember_extracted_text(pdf_upload_id, cache_key, timeout):
+    cache.set(_pdf_text_key(pdf_upload_id), cache_key, timeout)
+
+
+def evict_extracted_texts(*pdf_upload_ids):
+    """Drop the cached page texts of these uploads (a no-op for uploads that never used the cache)"""
+    if not pdf_upload_ids:
+        return
+    text_keys = cache.get_many([_pdf_text_key(pk) for pk in pdf_upload_ids])
+    if text_keys:
+        cache.delete_many([*text_keys.values(), *text_keys])
+
+
+# A running job refreshes claimed_at at every page checkpoint; a claim older than this belongs to a dead worker
+PROCESSING_LEASE_SECONDS = 30 * 60
+# Claims made before this process started cannot belong to a live job in this process (thread-mode resume)
+PROCESS_STARTED_AT = timezone.now()
+
+
+def processing_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+# account_info keys that PDFUpload also stores as columns (see set_account_summary)
+ACCOUNT_SUMMARY_FIELDS = (
+    'customer_name', 'account_number', 'iban_number', 'financial_period', 'opening_balance', 'closing_balance',
+)
+
+
 class PDFUpload(models.Model):
     """Model to store uploaded PDF files and their extraction results"""
     file = models.FileField(upload_to='pdfs/')
@@ -20,20 +121,125 @@ class PDFUpload(models.Model):
     pages_processed = models.IntegerField(default=0)
     monthly_analysis = models.JSONField(default=dict, blank=True)
     
+    # Account summary shown in the upload list, copied out of account_info so the list never reads the JSON
+    # (NULL where the extractor found no value, '' / 0 before extraction, as account_info.get(name, '') gave)
+    customer_name = models.TextField(null=True, blank=True, default='')
+    account_number = models.TextField(null=True, blank=True, default='')
+    iban_number = models.TextField(null=True, blank=True, default='')
+    financial_period = models.TextField(null=True, blank=True, default='')
+    opening_balance = models.FloatField(null=True, blank=True, default=0)
+    closing_balance = models.FloatField(null=True, blank=True, default=0)
+    
     # Progress tracking for resume
-    extracted_text_pages = models.JSONField(default=list, blank=True)  # Store text per page
+    page_texts_file = models.FileField(upload_to='page_texts/', null=True, blank=True)  # NDJSON, one line per extracted page
     current_page = models.IntegerField(default=0)  # Last completed page (0-indexed)
     
+    # Job ownership, so the upload path, startup resume and broker redelivery never run one PDF twice
+    claimed_by = models.CharField(max_length=255, blank=True, default='')  # host:pid:thread of the running job
+    claimed_at = models.DateTimeField(null=True, blank=True)  # Heartbeat, refreshed per page
+    task_attempts = models.PositiveSmallIntegerField(default=0)  # Celery deliveries of this upload's task
+    
     def __str__(self):
         return f"PDF Upload {self.id} - {self.file.name}"
+
+    def claimed_row(self):
+        """This upload's row, only while it still carries this instance's claim (a write fence for the job)"""
+        return PDFUpload.objects.filter(pk=self.pk, claimed_by=self.claimed_by)
+
+    def set_account_summary(self, account_info):
+        """Copy ACCOUNT_SUMMARY_FIELDS out of the extractor's account_info (missing keys keep the column default)"""
+        for name in ACCOUNT_SUMMARY_FIELDS:
+            value = account_info.get(name)
+            if value is None and (name not in account_info or not self._meta.get_field(name).null):
+                value = self._meta.get_field(name).default
+            setattr(self, name, value)
+
+    @classmethod
+    def claim_for_processing(cls, pk, takeover_before=None):
+        """Atomically claim a pending upload (None if gone, finished, or held by a claim newer than the lease/takeover_before)"""
+        now = timezone.now()
+        with transaction.atomic():
+            pdf_upload = cls.objects.select_for_update(skip_locked=True).filter(pk=pk).first()
+            if pdf_upload is None or pdf_upload.processed or pdf_upload.processing_error:
+                return None
+            if pdf_upload.claimed_at:
+                stale_before = now - timedelta(seconds=PROCESSING_LEASE_SECONDS)
+                if takeover_before and takeover_before > stale_before:
+                    stale_before = takeover_before
+                if pdf_upload.claimed_at >= stale_before:
+                    return None
+            pdf_upload.claimed_by = processing_worker_id()
+            pdf_upload.claimed_at = now
+            pdf_upload.save(update_fields=['claimed_by', 'claimed_at'])
+        return pdf_upload
+
+    @classmethod
+    def record_task_attempt(cls, pk):
+        """Count one more delivery of this upload's Celery task; returns the new count (None if it is gone)"""
+        with transaction.atomic():
+            cls.objects.filter(pk=pk).update(task_attempts=models.F('task_attempts') + 1)
+            return cls.objects.filter(pk=pk).values_list('task_attempts', flat=True).first()
+
+    def page_checkpoint_interval(self):
+        """Pages per resume checkpoint: 1 on local disk, PAGE_CHECKPOINT_INTERVAL on object storage (no append)"""
+        try:
+            self.page_texts_file.storage.path(f'pdf_{self.pk}.ndjson')
+        except NotImplementedError:
+            return getattr(django_settings, 'PAGE_CHECKPOINT_INTERVAL', 10)
+        return 1
+
+    def append_page_texts(self, pages):
+        """Append extracted (page_num, text) pairs to the resume buffer; the caller saves page_texts_file. Returns the
+        name of a superseded buffer object to delete once that is saved (object storage), else None."""
+        lines = b''.join(
+            (json.dumps({'page': page_num, 'text': text}, ensure_ascii=False) + '\n').encode('utf-8')
+            for page_num, text in pages
+        )
+        if not self.page_texts_file:
+            self.page_texts_file.save(f'pdf_{self.pk}.ndjson', ContentFile(lines), save=False)
+            return None
+        storage = self.page_texts_file.storage
+        name = self.page_texts_file.name
+        try:
+            path = storage.path(name)
+        except NotImplementedError:
+            # Object storage (S3) has no append; write the old and new lines to a new object, named after its
+            # last page, and keep the old one until the row points at the new one
+            with storage.open(name, 'rb') as f:
+                existing = f.read()
+            self.page_texts_file.save(f'pdf_{self.pk}_{pages[-1][0]}.ndjson', ContentFile(existing + lines), save=False)
+            return name
+        with open(path, 'ab') as f:
+            f.write(lines)
+        return None
+
+    def load_page_texts(self):
+        """Read the resume buffer back as a list of page texts (empty if nothing extracted yet)"""
+        if not self.page_texts_file:
+            return []
+        pages = []
+        with self.page_texts_file.storage.open(self.page_texts_file.name, 'rb') as f:
+            for raw in f:
+                if raw.strip():
+                    pages.append(json.loads(raw)['text'])
+        return pages
+
+    def clear_page_texts(self):
+        """Delete the resume buffer file, if any (does not save the row)"""
+        if self.page_texts_file:
+            self.page_texts_file.delete(save=False)
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Partial index: only in-flight rows, so the pending-cleanup and startup-resume scans stay tiny
+            models.Index(fields=['processed', 'id'], name='pdfupload_pending_idx', condition=models.Q(processed=False)),
+        ]
 
 class Transaction(models.Model):
     """Model to store individual transactions"""
     pdf_upload = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name='transactions')
-    date = models.CharField(max_length=20)
+    date = models.DateField(null=True, blank=True)
     description = models.TextField()
     debit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     credit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
@@ -44,11 +250,83 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['date']
+        indexes = [
+            models.Index(fields=['pdf_upload', 'date'], name='transaction_pdf_date_idx'),
+        ]
+
+
+# Default (Argon2id) hasher resolved once at import rather than on every make_password() call.
+# check_password still picks the hasher from the stored hash prefix.
+_HASHER = get_hasher('default')
+
+
+def hash_passcode(code: str) -> str:
+    """Encode a passcode with the default hasher (same output as make_password)."""
+    return _HASHER.encode(code, _HASHER.salt())
+
+
+# LRU memo of successful passcode verifies: passcode_hash -> (HMAC(code), verified_at).
+# Lets repeat logins skip the KDF. Keyed by the stored hash, so a reset (in any worker) misses.
+# Only positive results are kept; failures always pay the KDF and count towards the lockout.
+FAST_VERIFY_TTL_SECONDS = 300
+FAST_VERIFY_MAX_ENTRIES = 32
+_fast_verify_cache: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+_fast_verify_lock = threading.Lock()
+
+
+def _passcode_digest(code: str) -> bytes:
+    return hmac.new(django_settings.SECRET_KEY.encode(), code.encode(), hashlib.sha256).digest()
+
+
+@lru_cache(maxsize=1)
+def _dummy_passcode_hash() -> str:
+    """Throwaway hash computed once per process, verified against when no real hash is stored."""
+    return hash_passcode(secrets.token_hex(8))
+
+
+def _fast_verify_hit(passcode_hash: str, digest: bytes) -> bool:
+    with _fast_verify_lock:
+        cached = _fast_verify_cache.get(passcode_hash)
+        if cached is None:
+            return False
+        if time.monotonic() - cached[1] >= FAST_VERIFY_TTL_SECONDS:
+            del _fast_verify_cache[passcode_hash]
+            return False
+        _fast_verify_cache.move_to_end(passcode_hash)
+    return hmac.compare_digest(cached[0], digest)
+
+
+def _remember_fast_verify(passcode_hash: str, digest: bytes) -> None:
+    with _fast_verify_lock:
+        _fast_verify_cache[passcode_hash] = (digest, time.monotonic())
+        _fast_verify_cache.move_to_end(passcode_hash)
+        while len(_fast_verify_cache) > FAST_VERIFY_MAX_ENTRIES:
+            _fast_verify_cache.popitem(last=False)
+
+
+def _clear_fast_verify(passcode_hash=None) -> None:
+    """Forget the memo for one hash, or everything when the previous hash is unknown."""
+    with _fast_verify_lock:
+        if passcode_hash is None:
+            _fast_verify_cache.clear()
+        else:
+            _fast_verify_cache.pop(passcode_hash, None)
+
+
+# Shared (django.core.cache) copy of the singleton PasscodeConfig row as a plain field dict, so every
+# worker skips the SELECT. Mutations delete it once they commit (deleting earlier would let a concurrent read
+# re-cache the pre-commit row); the short TTL bounds staleness of lock countdowns.
+CONFIG_CACHE_KEY = 'passcode_config_v1'
+CONFIG_CACHE_TTL_SECONDS = 2
+
+
+def _invalidate_config_cache() -> None:
+    cache.delete(CONFIG_CACHE_KEY)
 
 
 class PasscodeConfig(models.Model):
     """Single-row model for passcode configuration and rate limiting"""
-    passcode_hash = models.CharField(max_length=255)
+    passcode_hash = models.CharField(max_length=128)  # Fits argon2id and PBKDF2 encodings
     passcode_configured = models.BooleanField(
         default=False,
         help_text="True once a passcode has been set (setup page hidden). Allows 000000 as a valid user passcode."
@@ -68,26 +346,68 @@ class PasscodeConfig(models.Model):
     class Meta:
         verbose_name = "Passcode Configuration"
         verbose_name_plural = "Passcode Configuration"
+        constraints = [
+            models.CheckConstraint(condition=models.Q(id=1), name='passcode_singleton'),
+        ]
     
     def __str__(self):
         return "Passcode Configuration"
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        hash_changed = update_fields is None or 'passcode_hash' in update_fields
+        if hash_changed:
+            _clear_fast_verify()
+        super().save(*args, **kwargs)
+        if hash_changed:
+            transaction.on_commit(_clear_fast_verify)
+        transaction.on_commit(_invalidate_config_cache)
     
     @classmethod
     def get_config(cls):
-        """Get or create the single configuration instance"""
-        config, created = cls.objects.get_or_create(
-            pk=1,
-            defaults={
-                'passcode_hash': make_password('000000'),  # Placeholder until first setup
-                'passcode_configured': False,
-                'expires_at': timezone.now() + timedelta(days=getattr(django_settings, 'PASSCODE_EXPIRY_DAYS', 7))
-            }
+        """Get or create the single configuration instance (cached briefly across workers)"""
+        cached = cache.get(CONFIG_CACHE_KEY)
+        if cached is not None:
+            return cls.from_db(cls.objects.db, list(cached), list(cached.values()))
+        try:
+            config = cls.objects.get(pk=1)
+        except cls.DoesNotExist:
+            # Only hash the placeholder when the row is actually created
+            config, created = cls.objects.get_or_create(
+                pk=1,
+                defaults={
+                    'passcode_hash': hash_passcode('000000'),  # Placeholder until first setup
+                    'passcode_configured': False,
+                    'expires_at': timezone.now() + timedelta(days=getattr(django_settings, 'PASSCODE_EXPIRY_DAYS', 7))
+                }
+            )
+        cache.set(
+            CONFIG_CACHE_KEY,
+            {f.attname: getattr(config, f.attname) for f in cls._meta.concrete_fields},
+            CONFIG_CACHE_TTL_SECONDS,
         )
         return config
     
     def is_passcode_valid(self, code: str) -> bool:
-        """Check if provided passcode matches"""
-        return check_password(code, self.passcode_hash)
+        """Check if provided passcode matches (always False while locked; upgrades legacy hashes on success)"""
+        if self.is_passcode_locked():
+            return False
+        if not self.passcode_hash:
+            # Pay the same KDF cost as a real check so timing does not reveal an unset passcode
+            check_password(code, _dummy_passcode_hash())
+            return False
+        digest = _passcode_digest(code)
+        if _fast_verify_hit(self.passcode_hash, digest):
+            return True
+        if not check_password(code, self.passcode_hash, setter=self._rehash_passcode):
+            return False
+        _remember_fast_verify(self.passcode_hash, digest)
+        return True
+
+    def _rehash_passcode(self, code: str) -> None:
+        """Re-encode the passcode with the preferred hasher; only the hash column is written."""
+        self.passcode_hash = hash_passcode(code)
+        self.save(update_fields=['passcode_hash'])
     
     def is_passcode_expired(self) -> bool:
         """Check if passcode has expired"""
@@ -110,46 +430,72 @@ class PasscodeConfig(models.Model):
         if self.passcode_locked_until and timezone.now() >= self.passcode_locked_until:
             self.passcode_attempts = 0
             self.passcode_locked_until = None
-            self.save()
+            self.save(update_fields=['passcode_attempts', 'passcode_locked_until'])
 
     def clear_expired_creds_lock(self) -> None:
         """If creds lock has expired, reset it and save. Call before reset check."""
         if self.creds_locked_until and timezone.now() >= self.creds_locked_until:
             self.creds_attempts = 0
             self.creds_locked_until = None
-            self.save()
+            self.save(update_fields=['creds_attempts', 'creds_locked_until'])
     
     def increment_passcode_attempts(self):
         """Increment passcode attempts and lock if needed"""
         max_attempts = getattr(django_settings, 'PASSCODE_MAX_ATTEMPTS', 5)
         lockout_minutes = getattr(django_settings, 'PASSCODE_LOCKOUT_MINUTES', 15)
-        self.passcode_attempts += 1
-        if self.passcode_attempts >= max_attempts:
-            self.passcode_locked_until = timezone.now() + timedelta(minutes=lockout_minutes)
-        self.save()
+        _clear_fast_verify(self.passcode_hash)
+        # Row lock serializes concurrent failures so the attacker cannot outrun the lockout
+        with transaction.atomic():
+            cfg = PasscodeConfig.objects.select_for_update().only(
+                'passcode_attempts', 'passcode_locked_until'
+            ).get(pk=self.pk)
+            cfg.passcode_attempts += 1
+            if cfg.passcode_attempts >= max_attempts:
+                cfg.passcode_locked_until = timezone.now() + timedelta(minutes=lockout_minutes)
+            cfg.save(update_fields=['passcode_attempts', 'passcode_locked_until'])
+        self.passcode_attempts = cfg.passcode_attempts
+        self.passcode_locked_until = cfg.passcode_locked_until
 
     def increment_creds_attempts(self):
         """Increment credential attempts and lock if needed"""
         max_attempts = getattr(django_settings, 'PASSCODE_MAX_ATTEMPTS', 5)
         lockout_minutes = getattr(django_settings, 'CREDS_LOCKOUT_MINUTES', 30)
-        self.creds_attempts += 1
-        if self.creds_attempts >= max_attempts:
-            self.creds_locked_until = timezone.now() + timedelta(minutes=lockout_minutes)
-        self.save()
+        with transaction.atomic():
+            cfg = PasscodeConfig.objects.select_for_update().only(
+                'creds_attempts', 'creds_locked_until'
+            ).get(pk=self.pk)
+            cfg.creds_attempts += 1
+            if cfg.creds_attempts >= max_attempts:
+                cfg.creds_locked_until = timezone.now() + timedelta(minutes=lockout_minutes)
+            cfg.save(update_fields=['creds_attempts', 'creds_locked_until'])
+        self.creds_attempts = cfg.creds_attempts
+        self.creds_locked_until = cfg.creds_locked_until
     
     def reset_attempts(self):
-        """Reset all attempt counters"""
+        """Reset all attempt counters (single targeted UPDATE; last_reset_at is left alone)"""
+        PasscodeConfig.objects.filter(pk=self.pk).update(
+            passcode_attempts=0,
+            creds_attempts=0,
+            passcode_locked_until=None,
+            creds_locked_until=None,
+        )
+        transaction.on_commit(_invalidate_config_cache)
         self.passcode_attempts = 0
         self.creds_attempts = 0
         self.passcode_locked_until = None
         self.creds_locked_until = None
-        self.save()
     
     def reset_passcode(self, new_code: str):
         """Reset passcode and update expiration. Marks passcode as configured (setup page no longer shown)."""
         expiry_days = getattr(django_settings, 'PASSCODE_EXPIRY_DAYS', 7)
-        self.passcode_hash = make_password(new_code)
+        self.passcode_hash = hash_passcode(new_code)
         self.passcode_configured = True
         self.expires_at = timezone.now() + timedelta(days=expiry_days)
-        self.reset_attempts()
-        self.save()
+        self.passcode_attempts = 0
+        self.creds_attempts = 0
+        self.passcode_locked_until = None
+        self.creds_locked_until = None
+        self.save(update_fields=[
+            'passcode_hash', 'passcode_configured', 'expires_at', 'last_reset_at',
+            'passcode_attempts', 'creds_attempts', 'passcode_locked_until', 'creds_locked_until',
+        ])
@@ -1,16 +1,166 @@
 import os
 import cv2
+import hashlib
+import zlib
 import numpy as np
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import fitz  # PyMuPDF
 import pytesseract
 import json
 import re
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Pages are preprocessed concurrently on the OCR pool (settings.OCR_WORKERS); OpenCV's own worker threads on top
+# of that would only oversubscribe the cores. Keep its SIMD/IPP code paths on.
+cv2.setUseOptimized(True)
+cv2.setNumThreads(1)
+
+# Patterns used from the per-line transaction loops, compiled once
+SAR_AMOUNT_RE = re.compile(r'(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*SAR')  # "25,631.50 SAR"
+SAR_CELL_RE = re.compile(r'([\d,]+\.?\d*)\s*SAR')  # Captures the number only
+RTL_DATE_RE = re.compile(r'(\d{4}/\d{2}/\d{2})')  # "2024/06/17"
+# Amounts with decimal point and at least 1 digit after, not part of a longer number
+DECIMAL_AMOUNT_RE = re.compile(r'(?<!\d)-?\d{1,3}(?:,\d{3})*\.\d+(?!\d)')
+WHITESPACE_RE = re.compile(r'\s+')
+# Runs of Arabic / Latin letters: detect_language counts characters run by run, not one match per character
+ARABIC_RUN_RE = re.compile(r'[\u0600-\u06FF]+')
+LATIN_RUN_RE = re.compile(r'[a-zA-Z]+')
+# Whitespace-separated word of three /- separated parts; drop_numeric_date checks the parts are numbers
+DATE_WORD_RE = re.compile(r'(?<!\S)([^\s/-]+)[/-]([^\s/-]+)[/-]([^\s/-]+)(?!\S)')
+# A text layer must contain one of these (English or Arabic statement table headers) to stand in for OCR
+TEXT_LAYER_KEYWORDS = ('Date', 'التاريخ', 'Balance', 'الرصيد')
+
+
+def field_value_regex(keyword):
+    """Regex capturing the text after a field label, up to the end of the line"""
+    return re.compile(rf'{re.escape(keyword)}\s*[:\s]*([^\n\r]+)', re.MULTILINE | re.IGNORECASE)
+
+
+def any_field_value_regex(keywords):
+    """field_value_regex for the first of several labels in the text; group 1 is set when it is keywords[0]
+    and the value is the "value" group"""
+    labels = '|'.join(f'({re.escape(keyword)})' for keyword in keywords)
+    return re.compile(rf'(?:{labels})\s*[:\s]*(?P<value>[^\n\r]+)', re.MULTILINE | re.IGNORECASE)
+
+
+@lru_cache(maxsize=8)
+def amount_hint_regex(currency_symbols):
+    """Regex matching any of the currency symbols, or a word made only of digits and ,.- with 3+ digits"""
+    alternatives = [re.escape(symbol) for symbol in currency_symbols]
+    alternatives.append(r'(?<!\S)[,.\-]*(?:\d[,.\-]*){3,}(?!\S)')
+    return re.compile('|'.join(alternatives))
+
+
+class NumberCharTable(dict):
+    """str.translate table keeping digits (str.isdigit) and .,- and deleting everything else; filled in per
+    code point on first sight, so it never holds more than the characters the statements actually use"""
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        kept = codepoint if char.isdigit() or char in ".,-" else None
+        self[codepoint] = kept
+        return kept
+
+
+NUMBER_CHARS = NumberCharTable()
+
+
+def drop_numeric_date(match):
+    """re.sub callback for DATE_WORD_RE: remove the word when all three parts are digits (str.isdigit)"""
+    return '' if all(part.isdigit() for part in match.groups()) else match.group()
+
+
+def new_month_stats():
+    """Empty per-month entry of analyze_monthly_transactions (a plain dict: it is stored as monthly_analysis JSON)"""
+    return {
+        'count': 0,
+        'total_debit': 0,
+        'total_credit': 0,
+        'opening_balance': None,
+        'closing_balance': None,
+        'minimum_balance': None,
+        'transactions': [],
+        'international_inward_count': 0,
+        'international_outward_count': 0,
+        'international_inward_total': 0,
+        'international_outward_total': 0
+    }
+
+
+def line_offsets(lines):
+    """Start offset of each of text.split('\\n') in text, plus len(text) + 1, so lines[i:j] span
+    text[offsets[i]:offsets[j] - 1]"""
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+    return offsets
+
+
+def transaction_key(transaction):
+    """Identity of an extracted transaction for duplicate detection (balances compared to the cent)"""
+    return transaction['date'], transaction['description'], round(transaction['balance'], 2)
+
+
+def date_line_regexes(date_patterns):
+    """Compile the configured date patterns into (regex, year_group, month_group, day_group) per separator.
+
+    A regex matches a whole stripped line the way the original split-and-int() parsing accepted it: the line
+    split on the separator has at least 3 parts and the year/month/day parts are integers (surrounding
+    whitespace allowed); any further parts are ignored."""
+    regexes = []
+    for pattern_config in date_patterns:
+        year_pos = pattern_config.get("year_position", 0)
+        month_pos = pattern_config.get("month_position", 1)
+        day_pos = pattern_config.get("day_position", 2)
+        for separator in pattern_config.get("separators", ["/", "-"]):
+            if not separator:
+                continue
+            sep = re.escape(separator)
+            groups = {}
+            parts = []
+            for position in range(max(year_pos, month_pos, day_pos, 2) + 1):
+                if position in (year_pos, month_pos, day_pos):
+                    groups[position] = len(groups) + 1
+                    parts.append(r'\s*\+?(\d+(?:_\d+)*)\s*')
+                else:
+                    parts.append(rf'(?:(?!{sep}).)*')
+            regex = re.compile(sep.join(parts) + rf'(?:{sep}.*)?', re.DOTALL)
+            regexes.append((regex, groups[year_pos], groups[month_pos], groups[day_pos]))
+    return regexes
+
+
+@lru_cache(maxsize=4096)
+def parse_statement_date(date_str):
+    """Convert date string or tuple to datetime object (memoized: statements repeat the same dates)"""
+    try:
+        if isinstance(date_str, tuple):
+            # Handle tuple format (year, month, day)
+            year, month, day = date_str
+            return datetime(int(year), int(month), int(day))
+        else:
+            # Handle string format
+            if '/' in str(date_str):
+                parts = str(date_str).split('/')
+                if len(parts) == 3:
+                    if len(parts[0]) == 4:  # YYYY/MM/DD
+                        return datetime(int(parts[0]), int(parts[1]), int(parts[2]))
+                    else:  # DD/MM/YYYY
+                        return datetime(int(parts[2]), int(parts[1]), int(parts[0]))
+            elif '-' in str(date_str):
+                parts = str(date_str).split('-')
+                if len(parts) == 3:
+                    return datetime(int(parts[0]), int(parts[1]), int(parts[2]))
+        return None
+    except:
+        return None
+
+
 class BankStatementExtractor:
     def __init__(self, config_path=None):
         # English patterns
@@ -42,6 +192,16 @@ class BankStatementExtractor:
             'credit': ['دائن', 'ايداع'],
             'balance': ['الرصيد', 'رصيد']
         }
+        # Compiled label regexes per language and field, in keyword priority order
+        self.field_regexes = {
+            language: {field: [field_value_regex(keyword) for keyword in keywords] for field, keywords in patterns.items()}
+            for language, patterns in (('arabic', self.arabic_patterns), ('english', self.english_patterns))
+        }
+        # All of a field's labels in one regex, so a document is scanned once per field in the common cases
+        self.any_field_regexes = {
+            language: {field: any_field_value_regex(keywords) for field, keywords in patterns.items()}
+            for language, patterns in (('arabic', self.arabic_patterns), ('english', self.english_patterns))
+        }
         """
         Initialize extractor with JSON configuration
         
@@ -52,8 +212,19 @@ class BankStatementExtractor:
             self.load_config_from_file(config_path)
         else:
             self.load_default_config()
+        self.compile_config_patterns()
 
-    
+    def compile_config_patterns(self):
+        """Compile the regexes and look up the settings derived from self.config (call again after changing the config)"""
+        self.date_regexes = date_line_regexes(self.config.get("date_patterns", []))
+        amount_config = self.config.get("amount_patterns", {})
+        clean_chars = amount_config.get("clean_chars", ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9", ".", ",", "-"])
+        # Everything except the clean_chars, dropped from amounts in one pass
+        kept = ''.join(re.escape(char) for char in clean_chars if len(char) == 1)
+        self.amount_noise_re = re.compile(f'[^{kept}]' if kept else '.', re.DOTALL)
+        # Settings read for every transaction candidate, looked up once here
+        self.currency_symbols = tuple(amount_config.get("currency_symbols", ["SAR"]))
+        self.search_lines_count = self.config.get("transaction_table", {}).get("search_lines_after", 10)
     
     def load_config_from_file(self, config_path):
         """Load configuration from JSON file"""
@@ -69,7 +240,11 @@ class BankStatementExtractor:
         """Load default configuration"""
         self.config = {
             "ocr_settings": {
-                "combined_config": "--oem 3 --psm 6 -l ara+eng"
+                "combined_config": "--oem 3 --psm 6 -l ara+eng",
+                "render_zoom": 2.0,
+                # Used when settings.OCR_FAST_MODE is on
+                "fast_config": "--oem 1 --psm 6 -l ara+eng",
+                "fast_render_zoom": 1.5
             },
             "field_patterns": {
                 "arabic": {
@@ -148,10 +323,8 @@ class BankStatementExtractor:
 
     def extract_single_amount_rtl(self,line):
         """Extract a single monetary amount from a line"""
-        # Pattern to match amounts like "25,631.50 SAR" or "0.00 SAR"
-        amount_pattern = r'(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*SAR'
-        
-        match = re.search(amount_pattern, line)
+        # Amounts like "25,631.50 SAR" or "0.00 SAR"
+        match = SAR_AMOUNT_RE.search(line)
         if match:
             # Clean the amount (remove commas)
             clean_amount = match.group(1).replace(',', '')
@@ -165,10 +338,7 @@ class BankStatementExtractor:
 
     def extract_date_from_line_rtl(self,line):
         """Extract date from line in format YYYY/MM/DD"""
-        # Pattern for date like "2024/06/17"
-        date_pattern = r'(\d{4}/\d{2}/\d{2})'
-        
-        match = re.search(date_pattern, line)
+        match = RTL_DATE_RE.search(line)
         if match:
             return match.group(1)
         
@@ -177,29 +347,26 @@ class BankStatementExtractor:
 
     def extract_field_value_different(self, text, field_name, language):
         """Extract field value from text based on patterns - using second occurrence"""
-        patterns = self.arabic_patterns if language == 'arabic' else self.english_patterns
+        language = 'arabic' if language == 'arabic' else 'english'
+        regexes = self.field_regexes[language].get(field_name)
         
-        if field_name not in patterns:
+        # One scan settles the usual case of a field with none of its labels in the text
+        if not regexes or not self.any_field_regexes[language][field_name].search(text):
             return None
         
-        for pattern in patterns[field_name]:
-            # Create regex pattern to find ALL occurrences
-            if language == 'arabic':
-                regex = rf'{re.escape(pattern)}\s*[:\s]*([^\n\r]+)'
-            else:
-                regex = rf'{re.escape(pattern)}\s*[:\s]*([^\n\r]+)'
-            
-            matches = re.findall(regex, text, re.MULTILINE | re.IGNORECASE)
+        for regex in regexes:
+            # Find ALL occurrences
+            matches = regex.findall(text)
             if len(matches) >= 2:
                 # Use the second occurrence
                 value = matches[1].strip()
                 # Clean up the value
-                value = re.sub(r'\s+', ' ', value)
+                value = WHITESPACE_RE.sub(' ', value)
                 return value
             elif len(matches) == 1:
                 # Fallback to first if only one exists
                 value = matches[0].strip()
-                value = re.sub(r'\s+', ' ', value)
+                value = WHITESPACE_RE.sub(' ', value)
                 return value
         
         return None
@@ -209,28 +376,27 @@ class BankStatementExtractor:
 
     def extract_field_value(self, text, field_name, language):
         """Extract field value from text based on patterns"""
-        patterns = self.arabic_patterns if language == 'arabic' else self.english_patterns
+        language = 'arabic' if language == 'arabic' else 'english'
+        regexes = self.field_regexes[language].get(field_name)
         
-        if field_name not in patterns:
+        if not regexes:
             return None
         
-        for pattern in patterns[field_name]:
-            # Create regex pattern to find the field and its value
-            if language == 'arabic':
-                # For Arabic, look for pattern followed by value
-                regex = rf'{re.escape(pattern)}\s*[:\s]*([^\n\r]+)'
-            else:
-                # For English, similar approach
-                regex = rf'{re.escape(pattern)}\s*[:\s]*([^\n\r]+)'
-            
-            match = re.search(regex, text, re.MULTILINE | re.IGNORECASE)
-            if match:
-                value = match.group(1).strip()
-                # Clean up the value
-                value = re.sub(r'\s+', ' ', value)
-                return value
+        # Find the field and its value. The first label found in the text is the answer when it is also the
+        # highest-priority label (or the only one there is); otherwise labels are tried in priority order.
+        match = self.any_field_regexes[language][field_name].search(text)
+        if match is None:
+            return None
+        value = match.group('value')
+        if match.group(1) is None:
+            for regex in regexes:
+                found = regex.search(text)
+                if found:
+                    value = found.group(1)
+                    break
         
-        return None
+        # Clean up the value
+        return WHITESPACE_RE.sub(' ', value.strip())
 
 
     
@@ -238,36 +404,27 @@ class BankStatementExtractor:
     
     def extract_date_from_text(self, text):
         """Extract date from text using JSON patterns"""
-        date_patterns = self.config.get("date_patterns", [])
-        lines = text.split('\n')
-        
-        for line in lines:
+        for line in text.split('\n'):
             line = line.strip()
-            if not line:
-                continue
-            
-            for pattern_config in date_patterns:
-                separators = pattern_config.get("separators", ["/", "-"])
+            if line:
+                date = self.extract_date_from_line(line)
+                if date:
+                    return date
+        
+        return None
+    
+    def extract_date_from_line(self, line):
+        """Date (year, month, day) of a stripped line, trying the configured patterns in order"""
+        for regex, year_group, month_group, day_group in self.date_regexes:
+            match = regex.fullmatch(line)
+            if match:
+                year = int(match.group(year_group))
+                month = int(match.group(month_group))
+                day = int(match.group(day_group))
                 
-                for separator in separators:
-                    if separator in line:
-                        parts = line.split(separator)
-                        if len(parts) >= 3:
-                            # Try to extract date components
-                            try:
-                                year_pos = pattern_config.get("year_position", 0)
-                                month_pos = pattern_config.get("month_position", 1)
-                                day_pos = pattern_config.get("day_position", 2)
-                                
-                                year = int(parts[year_pos])
-                                month = int(parts[month_pos])
-                                day = int(parts[day_pos])
-                                
-                                # Basic validation
-                                if 1900 <= year <= 2100 and 1 <= month <= 12 and 1 <= day <= 31:
-                                    return (year, month, day)
-                            except (ValueError, IndexError):
-                                continue
+                # Basic validation
+                if 1900 <= year <= 2100 and 1 <= month <= 12 and 1 <= day <= 31:
+                    return (year, month, day)
         
         return None
     
@@ -276,14 +433,8 @@ class BankStatementExtractor:
         if not amount_str:
             return None
         
-        amount_config = self.config.get("amount_patterns", {})
-        clean_chars = amount_config.get("clean_chars", ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9", ".", ",", "-"])
-        
-        # Clean the string
-        cleaned = ""
-        for char in amount_str:
-            if char in clean_chars:
-                cleaned += char
+        # Keep only the configured clean_chars
+        cleaned = self.amount_noise_re.sub('', amount_str)
         
         if not cleaned:
             return None
@@ -297,14 +448,19 @@ class BankStatementExtractor:
         except ValueError:
             return None
     
-    def preprocess_image(self, image):
-        """Preprocess image for better OCR accuracy"""
+    def preprocess_image(self, image, fast=False):
+        """Preprocess image for better OCR accuracy. fast: a single global threshold instead of the
+        blur/adaptive-threshold/close pipeline."""
         # Convert to grayscale
         if len(image.shape) == 3:
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         else:
             gray = image
         
+        if fast:
+            _, binary = cv2.threshold(gray, 155, 255, cv2.THRESH_BINARY)
+            return binary
+        
         # Apply Gaussian blur to reduce noise
         blurred = cv2.GaussianBlur(gray, (3, 3), 0)
         
@@ -319,9 +475,102 @@ class BankStatementExtractor:
         
         return cleaned
 
-    def extract_text_from_pdf(self, pdf_path, pdf_upload_id=None, start_page=0, existing_text=None):
-        """Extract text from PDF using PyMuPDF and OCR"""
-        from .models import PDFUpload
+    def render_page(self, doc, page_num, text_layer_min_chars=0, zoom=2.0):
+        """Direct text and OCR-ready image of a page (PyMuPDF documents are not thread-safe, so this runs on the
+        extracting thread). text_layer_min_chars: when non-zero, a page whose text layer has at least this many
+        characters and a table header keyword is not rendered, and the image is None."""
+        page = doc.load_page(page_num)
+        
+        # Try to extract text directly first
+        logger.info("[EXTRACTOR] Page %s: Extracting direct text...", page_num + 1)
+        direct_text = page.get_text()
+        if (text_layer_min_chars and len(direct_text.strip()) >= text_layer_min_chars
+                and any(keyword in direct_text for keyword in TEXT_LAYER_KEYWORDS)):
+            logger.info("[EXTRACTOR] Page %s: Text layer found, skipping OCR", page_num + 1)
+            return direct_text, None
+        
+        # Convert page to image for OCR
+        logger.info("[EXTRACTOR] Page %s: Converting to image for OCR...", page_num + 1)
+        mat = fitz.Matrix(zoom, zoom)  # Higher resolution
+        # Rendered as grayscale, which is all preprocess_image uses (a third of the pixel data of RGB)
+        pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY)
+        
+        # Convert to OpenCV format straight from the raw samples (no PNG encode/decode round trip)
+        image = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width)
+        return direct_text, image
+
+    def ocr_image(self, image, fast=False):
+        """Preprocess and OCR a rendered page. Runs on the OCR pool: OpenCV releases the GIL and Tesseract is a
+        subprocess, so pages are OCR'd in parallel."""
+        processed_image = self.preprocess_image(image, fast)
+        
+        # OCR extraction with Arabic+English
+        return pytesseract.image_to_string(
+            processed_image, config=self.get_ocr_config("fast_config" if fast else "combined_config")
+        )
+
+    def text_cache_seconds(self):
+        """EXTRACTED_TEXT_CACHE_SECONDS, or 0 when the cache backend can never return the texts (DummyCache)"""
+        from django.conf import settings
+        
+        if settings.CACHES['default']['BACKEND'].endswith('.DummyCache'):
+            return 0
+        return settings.EXTRACTED_TEXT_CACHE_SECONDS
+
+    def text_cache_key(self, pdf_path):
+        """Cache key for a PDF's extracted page texts: its content hash plus the settings that change OCR output"""
+        from django.conf import settings
+        
+        digest = hashlib.blake2b(digest_size=16)
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        ocr_options = [self.config["ocr_settings"], settings.OCR_FAST_MODE, settings.OCR_SKIP_MIN_TEXT_CHARS]
+        digest.update(json.dumps(ocr_options, sort_keys=True).encode())
+        return f'pdf_text_{digest.hexdigest()}'
+
+    def extract_text_from_pdf(self, pdf_path, pdf_upload_id=None, start_page=0, existing_text=None, claimed_by=None):
+        """Extract text from PDF using PyMuPDF and OCR. claimed_by: the job's PDFUpload claim; checkpoints only
+        write while the row still carries it, so a job whose claim was taken over stops instead of double-writing."""
+        from django.conf import settings
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .models import PDFUpload, is_pdf_processing_cancelled, set_pdf_progress, remember_extracted_text
+        
+        # One row read up front; per-page checkpoints reuse it and cancellation is signalled via flags
+        pdf_upload = None
+        if pdf_upload_id:
+            try:
+                pdf_upload = PDFUpload.objects.only('id', 'page_texts_file', 'current_page', 'claimed_by').get(id=pdf_upload_id)
+            except PDFUpload.DoesNotExist:
+                logger.info(f"[EXTRACTOR] PDF {pdf_upload_id} deleted before extraction started")
+                return None
+            owned = PDFUpload.objects.filter(pk=pdf_upload_id, claimed_by=claimed_by or pdf_upload.claimed_by)
+        
+        def stop_unowned(page_num, superseded_texts=None):
+            # Deleted without a cancel flag (e.g. by another process), or taken over by another worker
+            if PDFUpload.objects.filter(pk=pdf_upload_id).exists():
+                logger.warning("[EXTRACTOR] PDF %s claimed by another worker, stopping at page %s", pdf_upload_id, page_num + 1)
+                if superseded_texts:
+                    # The row still names the superseded buffer, now the new owner's; drop only this job's copy
+                    pdf_upload.clear_page_texts()
+            else:
+                logger.info("[EXTRACTOR] PDF %s deleted, stopping at page %s", pdf_upload_id, page_num + 1)
+                pdf_upload.clear_page_texts()
+                if superseded_texts:
+                    pdf_upload.page_texts_file.storage.delete(superseded_texts)
+            doc.close()
+        
+        # Re-uploads of the same statement reuse its page texts instead of OCRing it again
+        cache_seconds = self.text_cache_seconds()
+        cache_key = self.text_cache_key(pdf_path) if cache_seconds else None
+        if cache_key and start_page == 0:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("[EXTRACTOR] Page texts found in cache, skipping extraction")
+                if pdf_upload_id:
+                    remember_extracted_text(pdf_upload_id, cache_key, cache_seconds)
+                return json.loads(zlib.decompress(cached))
         
         doc = fitz.open(pdf_path)
         total_pages = len(doc)
@@ -329,68 +578,83 @@ class BankStatementExtractor:
         
         # Use existing text if resuming, otherwise start fresh
         all_text = existing_text if existing_text else []
-        
-        for page_num in range(start_page, total_pages):
-            page_start = datetime.now()
-            logger.info(f"[EXTRACTOR] Processing page {page_num + 1}/{total_pages}...")
-            
-            # Checkpoint: Check if PDF deleted after each page
-            if pdf_upload_id:
-                try:
-                    pdf_upload = PDFUpload.objects.get(id=pdf_upload_id)
-                except PDFUpload.DoesNotExist:
-                    logger.info(f"[EXTRACTOR] PDF {pdf_upload_id} deleted, stopping at page {page_num + 1}")
+        # Pages extracted since the last checkpoint (batched on object storage, see page_checkpoint_interval)
+        pending_pages = []
+        checkpoint_every = pdf_upload.page_checkpoint_interval() if pdf_upload else 0
+        
+        # Pages are OCR'd on a small pool while this thread renders ahead and checkpoints in page order
+        ocr_workers = max(1, settings.OCR_WORKERS)
+        text_layer_min_chars = settings.OCR_SKIP_MIN_TEXT_CHARS
+        fast_ocr = settings.OCR_FAST_MODE
+        ocr_settings = self.config["ocr_settings"]
+        zoom = ocr_settings.get("fast_render_zoom", 1.5) if fast_ocr else ocr_settings.get("render_zoom", 2.0)
+        executor = ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix='ocr')
+        # (page_start, direct_text, ocr_future) per rendered page, in page order
+        in_flight = deque()
+        next_page = start_page
+        try:
+            for page_num in range(start_page, total_pages):
+                logger.info("[EXTRACTOR] Processing page %s/%s...", page_num + 1, total_pages)
+                
+                # Checkpoint: stop if the PDF was stopped/deleted (flag set by the views, no DB query)
+                if pdf_upload and is_pdf_processing_cancelled(pdf_upload_id):
+                    logger.info("[EXTRACTOR] PDF %s cancelled, stopping at page %s", pdf_upload_id, page_num + 1)
                     doc.close()
                     return None
-            
-            page = doc.load_page(page_num)
-            
-            # Try to extract text directly first
-            logger.info(f"[EXTRACTOR] Page {page_num + 1}: Extracting direct text...")
-            direct_text = page.get_text()
-            
-            # Convert page to image for OCR
-            logger.info(f"[EXTRACTOR] Page {page_num + 1}: Converting to image for OCR...")
-            mat = fitz.Matrix(2.0, 2.0)  # Higher resolution
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
-            
-            # Convert to OpenCV format
-            nparr = np.frombuffer(img_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # Preprocess image
-            logger.info(f"[EXTRACTOR] Page {page_num + 1}: Preprocessing image...")
-            processed_image = self.preprocess_image(image)
-            
-            # OCR extraction with Arabic+English
-            logger.info(f"[EXTRACTOR] Page {page_num + 1}: Running OCR (this may take time)...")
-            ocr_text = pytesseract.image_to_string(
-                processed_image, config=self.get_ocr_config()
-            )
-            
-            # Combine direct text and OCR text
-            combined_text = direct_text + "\n" + ocr_text
-            all_text.append(combined_text)
-            
-            # Save progress to database after each page
-            if pdf_upload_id:
-                try:
-                    pdf_upload = PDFUpload.objects.get(id=pdf_upload_id)
-                    pdf_upload.extracted_text_pages = all_text.copy()
+                
+                # Keep every OCR worker busy, plus one page rendered ahead
+                while next_page < total_pages and len(in_flight) <= ocr_workers:
+                    page_start = time.perf_counter()
+                    direct_text, image = self.render_page(doc, next_page, text_layer_min_chars, zoom)
+                    ocr_future = executor.submit(self.ocr_image, image, fast_ocr) if image is not None else None
+                    in_flight.append((page_start, direct_text, ocr_future))
+                    next_page += 1
+                
+                page_start, direct_text, ocr_future = in_flight.popleft()
+                logger.info("[EXTRACTOR] Page %s: Waiting for OCR...", page_num + 1)
+                ocr_text = ocr_future.result() if ocr_future else ""
+                
+                # Combine direct text and OCR text
+                combined_text = direct_text + "\n" + ocr_text
+                all_text.append(combined_text)
+                
+                # Checkpoint progress: every page on local storage, every checkpoint_every pages on object storage
+                if pdf_upload:
+                    # Heartbeat every page (one-column UPDATE), right before any page-text write; no match means the
+                    # row was deleted or another worker took the claim over
+                    if not owned.update(claimed_at=timezone.now()):
+                        stop_unowned(page_num)
+                        return None
+                    pending_pages.append((page_num, combined_text))
+                    set_pdf_progress(pdf_upload_id, page_num + 1, total_pages)
+                if pending_pages and (len(pending_pages) >= checkpoint_every or page_num == total_pages - 1):
+                    superseded_texts = pdf_upload.append_page_texts(pending_pages)
+                    pending_pages = []
                     pdf_upload.current_page = page_num
-                    pdf_upload.save()
-                    logger.info(f"[EXTRACTOR] Progress saved: page {page_num + 1}/{total_pages}")
-                except PDFUpload.DoesNotExist:
-                    logger.info(f"[EXTRACTOR] PDF {pdf_upload_id} deleted, stopping at page {page_num + 1}")
-                    doc.close()
-                    return None
-            
-            page_elapsed = (datetime.now() - page_start).total_seconds()
-            logger.info(f"[EXTRACTOR] Page {page_num + 1}/{total_pages} completed in {page_elapsed:.2f} seconds")
+                    if not owned.update(page_texts_file=pdf_upload.page_texts_file.name, current_page=page_num):
+                        stop_unowned(page_num, superseded_texts)
+                        return None
+                    if superseded_texts:
+                        # Only once the row names the new buffer object, so a crash never loses checkpointed pages
+                        pdf_upload.page_texts_file.storage.delete(superseded_texts)
+                    logger.info("[EXTRACTOR] Progress saved: page %s/%s", page_num + 1, total_pages)
+                
+                page_elapsed = time.perf_counter() - page_start
+                logger.info("[EXTRACTOR] Page %s/%s completed in %.2f seconds", page_num + 1, total_pages, page_elapsed)
+        finally:
+            # On a stop, drop pages not yet started; OCR already running finishes in the background
+            executor.shutdown(wait=False, cancel_futures=True)
         
         doc.close()
         logger.info(f"[EXTRACTOR] All {total_pages} pages extracted successfully")
+        # Not for an upload deleted or stopped meanwhile: its eviction has already run
+        if cache_key and not (pdf_upload_id and is_pdf_processing_cancelled(pdf_upload_id)):
+            try:
+                cache.set(cache_key, zlib.compress(json.dumps(all_text).encode()), cache_seconds)
+                if pdf_upload_id:
+                    remember_extracted_text(pdf_upload_id, cache_key, cache_seconds)
+            except Exception as e:
+                logger.warning("[EXTRACTOR] Could not cache page texts: %s", e)
         return all_text
 
     def extract_account_info(self, text, language, different_amount_format):
@@ -426,26 +690,9 @@ class BankStatementExtractor:
     def date_to_datetime(self, date_str):
         """Convert date string or tuple to datetime object"""
         try:
-            if isinstance(date_str, tuple):
-                # Handle tuple format (year, month, day)
-                year, month, day = date_str
-                return datetime(int(year), int(month), int(day))
-            else:
-                # Handle string format
-                if '/' in str(date_str):
-                    parts = str(date_str).split('/')
-                    if len(parts) == 3:
-                        if len(parts[0]) == 4:  # YYYY/MM/DD
-                            return datetime(int(parts[0]), int(parts[1]), int(parts[2]))
-                        else:  # DD/MM/YYYY
-                            return datetime(int(parts[2]), int(parts[1]), int(parts[0]))
-                elif '-' in str(date_str):
-                    parts = str(date_str).split('-')
-                    if len(parts) == 3:
-                        return datetime(int(parts[0]), int(parts[1]), int(parts[2]))
-            return None
-        except:
-            return None
+            return parse_statement_date(date_str)
+        except TypeError:  # Unhashable input (e.g. a list); parse without the cache
+            return parse_statement_date.__wrapped__(date_str)
 
     def extract_header_from_second_page(self, text_pages):
         """Extract header text from the specific position in second page"""
@@ -535,27 +782,31 @@ class BankStatementExtractor:
         """Extract transaction details from all pages"""
         logger.info(f"[EXTRACTOR] Starting transaction extraction from {len(text_pages)} pages")
         transactions = []
+        # Keys of the transactions kept so far; catches repeats anywhere in the statement, e.g. a page's rows
+        # appearing in both its text layer and its OCR text
+        seen = set()
         last_valid_date = None
         
-        amount_config = self.config.get("amount_patterns", {})
-        currency_symbols = amount_config.get("currency_symbols", ["SAR"])
+        currency_symbols = self.currency_symbols
+        search_lines_count = self.search_lines_count
+        # Per-line helpers bound once, outside the loops
+        extract_date = self.extract_date_from_line
+        to_datetime = self.date_to_datetime
+        detect_amounts = self.detect_amounts_in_text
+        parse_line = self.parse_transaction_line
         
         for page_idx, page_text in enumerate(text_pages):
             transactions_before_page = len(transactions)
-            logger.info(f"[EXTRACTOR] Extracting transactions from page {page_idx + 1}/{len(text_pages)}...") 
+            logger.info("[EXTRACTOR] Extracting transactions from page %s/%s...", page_idx + 1, len(text_pages))
             lines = page_text.split('\n')
+            # Each line's date, parsed once per page
+            line_dates = [extract_date(line) if line else None for line in map(str.strip, lines)]
+            line_starts = line_offsets(lines)
             
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if not line:
-                    continue
-
-
+            for i, date_match in enumerate(line_dates):
                 # Look for date patterns in the line
-                date_match = self.extract_date_from_text(line)
-                
                 if date_match:
-                    current_date = self.date_to_datetime(date_match)
+                    current_date = to_datetime(date_match)
                     
                     if not current_date:
                         continue
@@ -564,31 +815,26 @@ class BankStatementExtractor:
                     if last_valid_date is not None and current_date < last_valid_date:
                         continue
                     
-                    # Check for monetary amounts in current and next few lines
-                    table_config = self.config.get("transaction_table", {})
-                    search_lines_count = table_config.get("search_lines_after", 10)
-                    search_lines = lines[i:i + search_lines_count]
-                    full_text = ' '.join(search_lines)
+                    # Check for monetary amounts in current and next few lines (one slice of the page text)
+                    full_text = page_text[line_starts[i]:line_starts[min(i + search_lines_count, len(lines))] - 1]
                     
                     # Amount detection
-                    has_amount = self.detect_amounts_in_text(full_text, currency_symbols)
+                    has_amount = detect_amounts(full_text, currency_symbols)
                     
                     if has_amount:
-                        transaction = self.parse_transaction_line(lines, i, language, different_amount_format)
+                        transaction = parse_line(lines, i, language, different_amount_format, date_match, full_text)
                         # transaction = self.parse_transaction_line(lines, i, language)
                         if transaction:
                             # Check for duplicate transactions
-                            if transactions:
-                                last_transaction = transactions[-1]
-                                if (last_transaction['date'] == transaction['date'] and 
-                                    last_transaction['description'] == transaction['description'] and
-                                    abs(float(last_transaction['balance']) - float(transaction['balance'])) < 0.01):
-                                    continue
+                            key = transaction_key(transaction)
+                            if key in seen:
+                                continue
+                            seen.add(key)
                             transactions.append(transaction)
                             last_valid_date = current_date
             
             transactions_on_page = len(transactions) - transactions_before_page
-            logger.info(f"[EXTRACTOR] Page {page_idx + 1}: Found {transactions_on_page} transactions (total: {len(transactions)})")
+            logger.info("[EXTRACTOR] Page %s: Found %s transactions (total: %s)", page_idx + 1, transactions_on_page, len(transactions))
         
         logger.info(f"[EXTRACTOR] Transaction extraction complete: {len(transactions)} total transactions found")
         return transactions
@@ -600,23 +846,35 @@ class BankStatementExtractor:
         """Extract transaction details from all pages"""
         logger.info(f"[EXTRACTOR] Starting RTL transaction extraction from {len(text_pages)} pages")
         transactions = []
+        # Keys of the transactions kept so far; catches repeats anywhere in the statement, e.g. a page's rows
+        # appearing in both its text layer and its OCR text
+        seen = set()
         last_valid_date = None
         
-        amount_config = self.config.get("amount_patterns", {})
-        currency_symbols = amount_config.get("currency_symbols", ["SAR"])
+        currency_symbols = self.currency_symbols
+        search_lines_count = self.search_lines_count
+        # Per-line helpers bound once, outside the loops
+        extract_amount = self.extract_single_amount_rtl
+        extract_date = self.extract_date_from_line_rtl
+        to_datetime = self.date_to_datetime
+        detect_amounts = self.detect_amounts_in_text
+        parse_line = self.parse_transaction_line_rtl
         
         for page_idx, page_text in enumerate(text_pages):
-            logger.info(f"[EXTRACTOR] Extracting RTL transactions from page {page_idx + 1}/{len(text_pages)}...") 
+            logger.info("[EXTRACTOR] Extracting RTL transactions from page %s/%s...", page_idx + 1, len(text_pages))
             lines = page_text.split('\n')
+            stripped_lines = [line.strip() for line in lines]
+            # Each line's amount and date, parsed once per page rather than once per lookahead window
+            line_amounts = [extract_amount(line) if line else None for line in stripped_lines]
+            line_dates = [extract_date(line) if line else None for line in stripped_lines]
+            line_starts = line_offsets(lines)
+            # Index of the first date line at or after each line (len(lines) when there is none)
+            next_date_line = [len(lines)] * (len(lines) + 1)
+            for k in range(len(lines) - 1, -1, -1):
+                next_date_line[k] = k if line_dates[k] else next_date_line[k + 1]
             
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if not line:
-                    continue
-
-
+            for i, first_amount in enumerate(line_amounts):
                 # FIRST CONDITION: Look for first amount (Balance)
-                first_amount = self.extract_single_amount_rtl(line)
                 if first_amount is not None:
                     # Look for next 2 amounts in subsequent lines (within reasonable range)
                     amounts = [first_amount]
@@ -624,61 +882,41 @@ class BankStatementExtractor:
                     
                     # Search for second and third amounts within next 15 lines
                     while j < len(lines) and j < i + 3 and len(amounts) < 3:
-                        next_line = lines[j].strip()
-                        if next_line:
-                            amount = self.extract_single_amount_rtl(next_line)
-                            if amount is not None:
-                                amounts.append(amount)
+                        amount = line_amounts[j]
+                        if amount is not None:
+                            amounts.append(amount)
                         j += 1
                     
                     # Check if we found exactly 3 amounts
                     if len(amounts) == 3:
 
 
-                        # Look for date in the following lines (extended range since dates are far)
-                        date_match = None
-                        description_lines = []
-                        
-                        # Search for date and description in next 50 lines from where we started
-                        for k in range(i, min(i + 50, len(lines))):
-                            search_line = lines[k].strip()
-                            if search_line:
-                                # Check for date
-                                if not date_match:
-                                    date_match = self.extract_date_from_line_rtl(search_line)
-                                
-                                # Collect description (skip amount and date lines)
-                                if (self.extract_single_amount_rtl(search_line) is None and 
-                                    not self.extract_date_from_line_rtl(search_line) and
-                                    len(search_line) > 3):  # Skip very short lines
-                                    description_lines.append(search_line)
+                        # Look for date in the next 50 lines from where we started (extended range since dates are far);
+                        # the description is built by parse_transaction_line_rtl
+                        date_line = next_date_line[i]
+                        date_match = line_dates[date_line] if date_line < min(i + 50, len(lines)) else None
                         
                         if date_match:
-                            current_date = self.date_to_datetime(date_match)
+                            current_date = to_datetime(date_match)
                     
                             if not current_date:
                                 continue
 
                             
-                            # Check for monetary amounts in current and next few lines
-                            table_config = self.config.get("transaction_table", {})
-                            search_lines_count = table_config.get("search_lines_after", 10)
-                            search_lines = lines[i:i + search_lines_count]
-                            full_text = ' '.join(search_lines)
+                            # Check for monetary amounts in current and next few lines (one slice of the page text)
+                            full_text = page_text[line_starts[i]:line_starts[min(i + search_lines_count, len(lines))] - 1]
 
                             # Amount detection
-                            has_amount = self.detect_amounts_in_text(full_text, currency_symbols)
+                            has_amount = detect_amounts(full_text, currency_symbols)
                     
                             if has_amount:
-                                transaction = self.parse_transaction_line_rtl(lines, i, language)
+                                transaction = parse_line(lines, i, language, full_text)
                                 if transaction:
                                     # Check for duplicate transactions
-                                    if transactions:
-                                        last_transaction = transactions[-1]
-                                        if (last_transaction['date'] == transaction['date'] and 
-                                            last_transaction['description'] == transaction['description'] and
-                                            abs(float(last_transaction['balance']) - float(transaction['balance'])) < 0.01):
-                                            continue
+                                    key = transaction_key(transaction)
+                                    if key in seen:
+                                        continue
+                                    seen.add(key)
                                     transactions.append(transaction)
                                     last_valid_date = current_date
                     
@@ -687,21 +925,9 @@ class BankStatementExtractor:
     
 
     def detect_amounts_in_text(self, text, currency_symbols):
-        """Detect if text contains monetary amounts"""
-        # Check for currency symbols
-        for currency in currency_symbols:
-            if currency in text:
-                return True
-        
-        # Check for numbers that could be amounts (3+ digits)
-        words = text.split()
-        for word in words:
-            # Remove common punctuation
-            clean_word = word.replace(',', '').replace('.', '').replace('-', '')
-            if clean_word.isdigit() and len(clean_word) >= 3:
-                return True
-        
-        return False
+        """Detect if text contains monetary amounts: a currency symbol, or a number that could be an amount
+        (a word of 3+ digits once , . and - are removed), in one regex scan"""
+        return amount_hint_regex(tuple(currency_symbols)).search(text) is not None
 
     
     def extract_amounts(self, full_text):
@@ -716,23 +942,20 @@ class BankStatementExtractor:
         # Use negative lookbehind and lookahead to avoid partial matches
         # Look for amounts that are closer together (within reasonable distance)
         
-        # Find all amounts first
-        all_amounts = re.findall(r'(?<!\d)-?\d{1,3}(?:,\d{3})*\.\d+(?!\d)', full_text)
+        # Find all amounts first, with their positions
+        matches = list(DECIMAL_AMOUNT_RE.finditer(full_text))
         
         # Look for consecutive amounts (within a reasonable character distance)
         rough_amounts = []
-        for i in range(len(all_amounts) - 1):
-            current_pos = full_text.find(all_amounts[i])
-            next_pos = full_text.find(all_amounts[i + 1], current_pos + len(all_amounts[i]))
-            
+        for current, following in zip(matches, matches[1:]):
             # If the next amount is within 50 characters, consider them consecutive
-            if next_pos - current_pos - len(all_amounts[i]) <= 50:
-                rough_amounts = [all_amounts[i], all_amounts[i + 1]]
+            if following.start() - current.end() <= 50:
+                rough_amounts = [current.group(), following.group()]
                 break
         
         # If no consecutive amounts found, fall back to first 2
         if not rough_amounts:
-            rough_amounts = all_amounts[:2]
+            rough_amounts = [match.group() for match in matches[:2]]
         
         
         if len(rough_amounts) < 2:
@@ -761,31 +984,30 @@ class BankStatementExtractor:
 
     
     # def parse_transaction_line(self, lines, line_index, language):
-    def parse_transaction_line(self, lines, line_index, language, different_amount_format):
-        """Parse a single transaction line"""
+    def parse_transaction_line(self, lines, line_index, language, different_amount_format, date_str=None, full_text=None):
+        """Parse a single transaction line. date_str: the line's already-parsed date, if the caller has it;
+        full_text: the search window's lines already joined (by spaces or newlines), if the caller has it"""
         try:
             current_line = lines[line_index]
             
             # Extract date
-            date_str = self.extract_date_from_text(current_line)
+            if date_str is None:
+                date_str = self.extract_date_from_text(current_line)
             if not date_str:
                 return None
             
             # Get search configuration
-            table_config = self.config.get("transaction_table", {})
-            search_lines_count = table_config.get("search_lines_after", 10)
-            search_lines = lines[line_index:line_index + search_lines_count]
-            full_text = ' '.join(search_lines)
+            search_lines = lines[line_index:line_index + self.search_lines_count]
+            if full_text is None:
+                full_text = ' '.join(search_lines)
 
             if(different_amount_format):
                 amounts = self.extract_amounts(full_text)
             else:
                 # Extract amounts
                 # Extract amounts using patterns
-                rough_amounts = re.findall(r'[\d,]+\.?\d*\s*SAR', full_text)
-                # rough_amounts = self.extract_all_amounts(full_text)
-
-                amounts = [float(cell.replace(' SAR', '').replace(',', '')) for cell in rough_amounts]
+                amounts = [float(cell.replace(',', '')) for cell in SAR_CELL_RE.findall(full_text)]
+                # amounts = self.extract_all_amounts(full_text)
 
             
             if not amounts:
@@ -819,16 +1041,15 @@ class BankStatementExtractor:
 
     
 
-    def parse_transaction_line_rtl(self, lines, line_index, language):
-        """Parse a single transaction line"""
+    def parse_transaction_line_rtl(self, lines, line_index, language, full_text=None):
+        """Parse a single transaction line. full_text: as for parse_transaction_line"""
         try:
             current_line = lines[line_index]
             
             # Get search configuration
-            table_config = self.config.get("transaction_table", {})
-            search_lines_count = table_config.get("search_lines_after", 10)
-            search_lines = lines[line_index:line_index + search_lines_count]
-            full_text = ' '.join(search_lines)
+            search_lines = lines[line_index:line_index + self.search_lines_count]
+            if full_text is None:
+                full_text = ' '.join(search_lines)
 
             
             date_str = self. extract_date_from_line_rtl(full_text)
@@ -837,10 +1058,8 @@ class BankStatementExtractor:
             
             # Extract amounts
             # Extract amounts using patterns
-            rough_amounts = re.findall(r'[\d,]+\.?\d*\s*SAR', full_text)
-            # rough_amounts = self.extract_all_amounts(full_text)
-
-            amounts = [float(cell.replace(' SAR', '').replace(',', '')) for cell in rough_amounts]
+            amounts = [float(cell.replace(',', '')) for cell in SAR_CELL_RE.findall(full_text)]
+            # amounts = self.extract_all_amounts(full_text)
 
             
             if not amounts:
@@ -874,11 +1093,9 @@ class BankStatementExtractor:
     def extract_all_amounts(self, text):
         """Extract all amounts from text"""
         amounts = []
-        amount_config = self.config.get("amount_patterns", {})
-        currency_symbols = amount_config.get("currency_symbols", ["SAR"])
         
         # Method 1: Look for currency symbols
-        for currency in currency_symbols:
+        for currency in self.currency_symbols:
             if currency in text:
                 parts = text.split(currency)
                 for i, part in enumerate(parts[:-1]):
@@ -908,15 +1125,9 @@ class BankStatementExtractor:
         if not text:
             return None
         
-        # Remove common non-numeric characters except digits, dots, commas, and minus
-        cleaned = ""
-        for char in text:
-            if char.isdigit() or char in ".,-":
-                cleaned += char
-        
-        # Handle comma-separated numbers
-        if "," in cleaned:
-            cleaned = cleaned.replace(",", "")
+        # Remove common non-numeric characters except digits, dots, commas, and minus, then the commas of
+        # comma-separated numbers
+        cleaned = text.translate(NUMBER_CHARS).replace(",", "")
         
         return cleaned if cleaned else None
 
@@ -953,50 +1164,53 @@ class BankStatementExtractor:
     def extract_transaction_description(self, search_lines, amounts):
         """Extract transaction description from search lines"""
         description_parts = []
+        # Same per-line strings every line (repeated amounts only need removing once)
+        amount_strings = list(dict.fromkeys(str(amount) for amount in amounts))
+        currency_symbols = self.currency_symbols
         
         for line in search_lines:
             # Remove amounts and dates from description
             clean_line = line
-            for amount in amounts:
-                clean_line = clean_line.replace(str(amount), "")
+            for amount_string in amount_strings:
+                clean_line = clean_line.replace(amount_string, "")
             clean_line = self.remove_dates_from_text(clean_line)
             
             # Remove currency symbols
-            amount_config = self.config.get("amount_patterns", {})
-            currency_symbols = amount_config.get("currency_symbols", ["SAR"])
             for currency in currency_symbols:
                 clean_line = clean_line.replace(currency, "")
             
             # Clean up extra whitespace
             clean_line = ' '.join(clean_line.split())
             
-            if clean_line.strip():
-                description_parts.append(clean_line.strip())
+            if clean_line:
+                description_parts.append(clean_line)
+                if len(description_parts) == 3:  # Only the first 3 parts are used
+                    break
         
         # Combine description parts, limit length
-        description = ' '.join(description_parts[:3])  # Take first 3 parts
+        description = ' '.join(description_parts)
         return description[:100]  # Limit to 100 characters
 
 
     def extract_rtl_transaction_description(self, search_lines, amounts, date_str):
         """Extract and clean transaction description from search_lines"""
-        # Skip first 3 amount lines, then collect until date is found
+        # Skip everything up to the first 3 amount lines (lines containing SAR); no description without them
         amount_lines_skipped = 0
-        description_lines = []
-        
-        for line in search_lines:
-            # Skip first 3 amount lines (lines containing SAR)
-            if 'SAR' in line and amount_lines_skipped < 3:
+        start = len(search_lines)
+        for index, line in enumerate(search_lines):
+            if 'SAR' in line:
                 amount_lines_skipped += 1
-                continue
-            
-            # After skipping 3 amount lines, collect everything until exact date is found
-            if amount_lines_skipped >= 3:
-                if date_str in line:
-                    # Include the line with date_str and break
-                    description_lines.append(line)
+                if amount_lines_skipped == 3:
+                    start = index + 1
                     break
-                description_lines.append(line)
+        
+        # After skipping 3 amount lines, collect everything until exact date is found
+        description_lines = search_lines[start:]
+        for offset, line in enumerate(description_lines):
+            if date_str in line:
+                # Include the line with date_str and stop
+                description_lines = description_lines[:offset + 1]
+                break
         
         # Join lines with spaces only
         description = ' '.join(line for line in description_lines if line.strip())
@@ -1008,40 +1222,14 @@ class BankStatementExtractor:
     
 
     def remove_dates_from_text(self, text):
-        """Remove date patterns from text"""
-        words = text.split()
-        filtered_words = []
-        
-        for word in words:
-            # Skip if it looks like a date
-            if '/' in word or '-' in word:
-                parts = word.replace('/', '-').split('-')
-                if len(parts) == 3:
-                    try:
-                        # Check if all parts are numbers
-                        if all(part.isdigit() for part in parts):
-                            continue  # Skip this word
-                    except:
-                        pass
-            filtered_words.append(word)
-        
-        return ' '.join(filtered_words)
+        """Remove date patterns (words of three numbers joined by / or -) from text"""
+        return ' '.join(DATE_WORD_RE.sub(drop_numeric_date, text).split())
 
     def analyze_monthly_transactions(self, transactions):
         """Analyze transactions by month with opening and closing balances (separated by year)"""
-        monthly_stats = defaultdict(lambda: {
-            'count': 0,
-            'total_debit': 0,
-            'total_credit': 0,
-            'opening_balance': None,
-            'closing_balance': None,
-            'minimum_balance': None,
-            'transactions': [],
-            'international_inward_count': 0,
-            'international_outward_count': 0,
-            'international_inward_total': 0,
-            'international_outward_total': 0
-        })
+        monthly_stats = {}
+        # Parsed date of each of a month's stats['transactions'], in the same order, for sorting
+        month_dates = defaultdict(list)
         
         for transaction in transactions:
             try:
@@ -1052,25 +1240,31 @@ class BankStatementExtractor:
                     continue
                 
                 year_month = date_obj.strftime('%Y-%m')
-
-                monthly_stats[year_month]['count'] += 1
-                monthly_stats[year_month]['total_debit'] += float(transaction.get('debit', 0))
-                monthly_stats[year_month]['total_credit'] += float(transaction.get('credit', 0))
-                monthly_stats[year_month]['transactions'].append(transaction)
+                stats = monthly_stats.get(year_month)
+                if stats is None:
+                    stats = monthly_stats[year_month] = new_month_stats()
+                debit_amount = float(transaction.get('debit', 0))
+                credit_amount = float(transaction.get('credit', 0))
+                balance = float(transaction.get('balance', 0))
+
+                stats['count'] += 1
+                stats['total_debit'] += debit_amount
+                stats['total_credit'] += credit_amount
+                stats['transactions'].append(transaction)
+                month_dates[year_month].append(date_obj)
+                if stats['minimum_balance'] is None or balance < stats['minimum_balance']:
+                    stats['minimum_balance'] = balance
 
                 # Check for international transactions (IPS in description)
                 description = transaction.get('description', '')
                 if 'IPS' in description:
-                    debit_amount = float(transaction.get('debit', 0))
-                    credit_amount = float(transaction.get('credit', 0))
-                    
                     if credit_amount > 0:  # Inward transaction
-                        monthly_stats[year_month]['international_inward_count'] += 1
-                        monthly_stats[year_month]['international_inward_total'] += credit_amount
+                        stats['international_inward_count'] += 1
+                        stats['international_inward_total'] += credit_amount
                     
                     if debit_amount > 0:  # Outward transaction
-                        monthly_stats[year_month]['international_outward_count'] += 1
-                        monthly_stats[year_month]['international_outward_total'] += debit_amount
+                        stats['international_outward_count'] += 1
+                        stats['international_outward_total'] += debit_amount
                 
             except Exception as e:
                 logger.warning("Error processing transaction date: %s", e)
@@ -1080,8 +1274,10 @@ class BankStatementExtractor:
         for year_month, stats in monthly_stats.items():
             transactions_in_month = stats['transactions']
             if transactions_in_month:
-                # Sort transactions by date
-                transactions_in_month.sort(key=lambda x: self.date_to_datetime(x['date']))
+                # Sort transactions by date (stable, by the dates parsed above)
+                dates = month_dates[year_month]
+                order = sorted(range(len(dates)), key=dates.__getitem__)
+                transactions_in_month[:] = [transactions_in_month[i] for i in order]
                 # First transaction of month gives opening balance (balance before this transaction)
                 first_transaction = transactions_in_month[0]
                 first_balance = float(first_transaction.get('balance', 0))
@@ -1092,9 +1288,7 @@ class BankStatementExtractor:
                 # Last transaction of month gives closing balance
                 last_transaction = transactions_in_month[-1]
                 stats['closing_balance'] = float(last_transaction.get('balance', 0))
-                # Calculate minimum balance for the month
-                balances = [float(t.get('balance', 0)) for t in transactions_in_month]
-                stats['minimum_balance'] = min(balances) if balances else None
+                # Minimum balance for the month is tracked in the loop above
                 # Correct net_change and fluctuation calculations
                 inflow = stats['total_credit']
                 outflow = abs(stats['total_debit'])
@@ -1110,23 +1304,23 @@ class BankStatementExtractor:
 
                 
         
-        return dict(monthly_stats)
+        return monthly_stats
 
     def detect_language(self, text):
         """Detect if text is primarily Arabic or English"""
-        arabic_chars = len(re.findall(r'[\u0600-\u06FF]', text))
-        english_chars = len(re.findall(r'[a-zA-Z]', text))
+        arabic_chars = sum(match.end() - match.start() for match in ARABIC_RUN_RE.finditer(text))
+        english_chars = sum(match.end() - match.start() for match in LATIN_RUN_RE.finditer(text))
         
         return 'arabic' if arabic_chars > english_chars else 'english'
 
-    def process_bank_statement(self, pdf_path, pdf_upload_id=None, start_page=0, existing_text=None):
+    def process_bank_statement(self, pdf_path, pdf_upload_id=None, start_page=0, existing_text=None, claimed_by=None):
         """Main method to process bank statement PDF"""
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         logger.info(f"[EXTRACTOR] Starting bank statement processing: {pdf_path}, start_page={start_page}")
         
         # Extract text from PDF
         logger.info(f"[EXTRACTOR] Step 1: Extracting text from PDF...")
-        text_pages = self.extract_text_from_pdf(pdf_path, pdf_upload_id, start_page, existing_text)
+        text_pages = self.extract_text_from_pdf(pdf_path, pdf_upload_id, start_page, existing_text, claimed_by)
         
         if not text_pages:
             # Check if PDF was deleted (None means deleted, empty list means error)
@@ -1180,7 +1374,7 @@ class BankStatementExtractor:
         logger.info(f"[EXTRACTOR] Step 7 complete: Analytics calculated")
         
         # Compile results
-        elapsed = (datetime.now() - start_time).total_seconds()
+        elapsed = time.perf_counter() - start_time
         logger.info(f"[EXTRACTOR] Processing complete: {len(text_pages)} pages, {len(transactions)} transactions in {elapsed:.2f} seconds")
         
         results = {
@@ -1229,28 +1423,50 @@ class BankStatementExtractor:
                 'overdraft_frequency': 0,
                 'overdraft_total_days': 0
             }
-        months = list(monthly_analysis.values())
+        # One pass over the months collects every series below (totals still use sum(), which rounds differently
+        # from a running += on Python 3.12+)
+        fluctuation_values = []
+        # Net change mean and sum of squared deviations, updated per month (Welford's online algorithm)
+        net_change_count = 0
+        mean_net_change = 0.0
+        net_change_m2 = 0.0
+        foreign_amounts = []
+        inflows = []
+        outflows = []
+        total_foreign_transactions = 0
+        for m in monthly_analysis.values():
+            fluctuation = m.get('fluctuation')
+            if fluctuation is not None:
+                fluctuation_values.append(fluctuation)
+            net_change = m.get('net_change')
+            if net_change is not None:
+                net_change_count += 1
+                delta = net_change - mean_net_change
+                mean_net_change += delta / net_change_count
+                net_change_m2 += delta * (net_change - mean_net_change)
+            total_foreign_transactions += m.get('international_inward_count', 0) + m.get('international_outward_count', 0)
+            foreign_amounts.append(m.get('international_inward_total', 0) + m.get('international_outward_total', 0))
+            total_credit = m.get('total_credit')
+            if total_credit is not None:
+                inflows.append(total_credit)
+            total_debit = m.get('total_debit')
+            if total_debit is not None:
+                outflows.append(abs(total_debit))
         # Average fluctuation: mean of all months' fluctuation
-        fluctuation_values = [m.get('fluctuation', 0) for m in months if m.get('fluctuation') is not None]
         if fluctuation_values:
             avg_fluctuation = sum(fluctuation_values) / len(fluctuation_values)
         else:
             avg_fluctuation = 0
         # Cash Flow Stability: STDEV(net change) / AVERAGE(net change)
-        net_changes = [m.get('net_change', 0) for m in months if m.get('net_change') is not None]
-        if net_changes and len(net_changes) > 1:
-            mean_net_change = sum(net_changes) / len(net_changes)
-            variance = sum((x - mean_net_change) ** 2 for x in net_changes) / (len(net_changes) - 1)
+        if net_change_count > 1:
+            variance = net_change_m2 / (net_change_count - 1)
             stdev = variance ** 0.5
             cash_flow_stability = stdev / mean_net_change if mean_net_change != 0 else 0
         else:
             cash_flow_stability = 0
         # Total foreign transactions and amount: sum of all months (inward + outward)
-        total_foreign_transactions = sum(m.get('international_inward_count', 0) + m.get('international_outward_count', 0) for m in months)
-        total_foreign_amount = sum(m.get('international_inward_total', 0) + m.get('international_outward_total', 0) for m in months)
+        total_foreign_amount = sum(foreign_amounts)
         # Sum and average of total inflow and outflow for all months
-        inflows = [m.get('total_credit', 0) for m in months if m.get('total_credit') is not None]
-        outflows = [abs(m.get('total_debit', 0)) for m in months if m.get('total_debit') is not None]
         sum_inflow = sum(inflows)
         sum_outflow = sum(outflows)
         avg_inflow = sum_inflow / len(inflows) if inflows else 0
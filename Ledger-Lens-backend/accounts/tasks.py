@@ -0,0 +1,26 @@
+from celery import shared_task
+from django.utils import timezone
+
+from .models import PDFUpload
+from .views import process_pdf_background, record_processing_error
+
+# Deliveries of one upload's task before it is marked failed: a PDF that keeps killing its worker (e.g. OOM)
+# is redelivered by reject_on_worker_lost, and would otherwise be retried forever
+MAX_TASK_ATTEMPTS = 3
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_pdf_task(self, pdf_upload_id):
+    """Celery entry point for PDF extraction; a redelivered job resumes from the saved page checkpoint"""
+    attempts = PDFUpload.record_task_attempt(pdf_upload_id)
+    if attempts is None:
+        return
+    if attempts > MAX_TASK_ATTEMPTS:
+        # The earlier deliveries' workers are gone, so their claim can be taken over at once
+        pdf_upload = PDFUpload.claim_for_processing(pdf_upload_id, takeover_before=timezone.now())
+        if pdf_upload is not None:
+            record_processing_error(pdf_upload, "PDF processing failed repeatedly")
+        return
+    # Redelivery means the previous worker died, so its claim can be taken over without waiting for the lease
+    redelivered = (self.request.delivery_info or {}).get('redelivered')
+    process_pdf_background(pdf_upload_id, takeover_before=timezone.now() if redelivered else None)
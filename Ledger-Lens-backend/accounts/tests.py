@@ -1,3 +1,684 @@
-from django.test import TestCase
+import itertools
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import InMemoryStorage
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import models, pdf_extractor, views
+from .models import PasscodeConfig, PDFUpload, Transaction
+from .pdf_extractor import BankStatementExtractor
+
+
+class PasscodeMemoTests(TestCase):
+    """The fast-verify memo must never outlive the hash or the lockout it was built from"""
+
+    def setUp(self):
+        cache.clear()
+        models._clear_fast_verify()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config = PasscodeConfig.get_config()
+            self.config.reset_passcode('123456')
+
+    def test_reset_clears_memo(self):
+        self.assertTrue(self.config.is_passcode_valid('123456'))
+        old_hash = self.config.passcode_hash
+        self.assertIn(old_hash, models._fast_verify_cache)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.reset_passcode('654321')
+
+        self.assertNotIn(old_hash, models._fast_verify_cache)
+        config = PasscodeConfig.get_config()
+        self.assertFalse(config.is_passcode_valid('123456'))
+        self.assertTrue(config.is_passcode_valid('654321'))
+
+    def test_reset_is_one_update(self):
+        self.config.increment_passcode_attempts()
+        self.config.increment_creds_attempts()
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            self.config.reset_passcode('654321')
+        self.assertEqual(callbacks.count(models._invalidate_config_cache), 1)
+        config = PasscodeConfig.objects.get(pk=1)
+        self.assertEqual((config.passcode_attempts, config.creds_attempts), (0, 0))
+        self.assertIsNone(config.passcode_locked_until)
+        self.assertIsNone(config.creds_locked_until)
+
+    def test_failed_attempt_clears_memo(self):
+        self.assertTrue(self.config.is_passcode_valid('123456'))
+        self.assertIn(self.config.passcode_hash, models._fast_verify_cache)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.increment_passcode_attempts()
+
+        self.assertNotIn(self.config.passcode_hash, models._fast_verify_cache)
+        self.assertEqual(self.config.passcode_attempts, 1)
+
+    def test_locked_config_skips_kdf(self):
+        self.assertTrue(self.config.is_passcode_valid('123456'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.passcode_locked_until = timezone.now() + timedelta(minutes=15)
+            self.config.save(update_fields=['passcode_locked_until'])
+
+        with mock.patch.object(models, 'check_password') as check_password:
+            self.assertFalse(self.config.is_passcode_valid('123456'))
+            self.assertFalse(PasscodeConfig.get_config().is_passcode_valid('123456'))
+        check_password.assert_not_called()
+
+
+class LoginAttemptLimitTests(TestCase):
+    """login_with_passcode reads the attempt limit per request, so override_settings applies"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            PasscodeConfig.get_config().reset_passcode('123456')
+
+    @override_settings(PASSCODE_MAX_ATTEMPTS=2)
+    def test_out_of_attempts_skips_the_hash(self):
+        PasscodeConfig.objects.filter(pk=1).update(passcode_attempts=2)
+        models._invalidate_config_cache()
+        with mock.patch.object(models, 'check_password') as check_password:
+            response = self.client.post(reverse('login'), {'passcode': '123456'}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        check_password.assert_not_called()
+
+    @override_settings(PASSCODE_MAX_ATTEMPTS=2)
+    def test_remaining_attempts_follow_the_setting(self):
+        response = self.client.post(reverse('login'), {'passcode': '000001'}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error'], 'Incorrect passcode. 1 attempts remaining.')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks')
+class ConcurrentLockoutTests(TransactionTestCase):
+    """Concurrent failed attempts must all be counted and reach the lock"""
+
+    def setUp(self):
+        cache.clear()
+        PasscodeConfig.get_config().reset_passcode('123456')
+
+    def test_concurrent_failures_reach_lock(self):
+        max_attempts = getattr(settings, 'PASSCODE_MAX_ATTEMPTS', 5)
+        barrier = threading.Barrier(max_attempts)
+        errors = []
+
+        def fail_once():
+            try:
+                config = PasscodeConfig.objects.get(pk=1)
+                barrier.wait()
+                config.increment_passcode_attempts()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=fail_once) for _ in range(max_attempts)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        config = PasscodeConfig.objects.get(pk=1)
+        self.assertEqual(config.passcode_attempts, max_attempts)
+        self.assertTrue(config.is_passcode_locked())
+
+
+class InsertTransactionsTests(TestCase):
+    """The COPY and bulk_create paths must store the same rows"""
+
+    TRANSACTIONS = [
+        {'date': '2024/01/15', 'description': 'POS Purchase', 'debit': 12.5, 'credit': 0, 'balance': 987.5},
+        {'date': '2024/01/16', 'description': '', 'debit': 0, 'credit': 0.1, 'balance': 987.6},
+        {'description': 'Opening entry', 'debit': 0, 'credit': 0, 'balance': 0},
+    ]
+
+    def stored_rows(self, threshold):
+        pdf_upload = PDFUpload.objects.create(file='pdfs/statement.pdf')
+        with mock.patch.object(views, 'TRANSACTION_COPY_THRESHOLD', threshold):
+            count = views.insert_transactions(pdf_upload, self.TRANSACTIONS, BankStatementExtractor())
+        self.assertEqual(count, len(self.TRANSACTIONS))
+        return list(
+            Transaction.objects.filter(pdf_upload=pdf_upload)
+            .order_by('id')
+            .values_list('date', 'description', 'debit', 'credit', 'balance')
+        )
+
+    def test_bulk_create_path(self):
+        self.assertEqual(self.stored_rows(len(self.TRANSACTIONS)), [
+            (date(2024, 1, 15), 'POS Purchase', Decimal('12.50'), Decimal('0.00'), Decimal('987.50')),
+            (date(2024, 1, 16), '', Decimal('0.00'), Decimal('0.10'), Decimal('987.60')),
+            (None, 'Opening entry', Decimal('0.00'), Decimal('0.00'), Decimal('0.00')),
+        ])
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY is PostgreSQL only')
+    def test_copy_path_matches_bulk_create(self):
+        self.assertEqual(self.stored_rows(0), self.stored_rows(len(self.TRANSACTIONS)))
+
+
+# Lines as they come out of the text layer / OCR of English and Arabic statements
+STATEMENT_LINES = [
+    'Account Statement',
+    'Customer Name: MOHAMMED A ALQAHTANI',
+    'Account Number : 123456789012',
+    'IBAN Number: SA44 2000 0001 2345 6789 1234',
+    'On The Period 2024/01/01 - 2024/01/31',
+    'Opening Balance 1,000.00 SAR',
+    'Date Description Debit Credit Balance',
+    '2024/01/03',
+    '  2024/01/05  ',
+    '2024-01-09',
+    '09/01/2024',
+    '31-12-2023',
+    '2024 / 02 / 14',
+    '2024/13/01',
+    '2024/02/30',
+    '1899/01/01',
+    '2024/01/03 POS Purchase PANDA RIYADH',
+    '2024/01/03/1',
+    '٢٠٢٤/٠١/١٥',
+    'POS Purchase PANDA RIYADH',
+    '-45.00 SAR 0.00 SAR 955.00 SAR',
+    '0.00 SAR 8,500.00 SAR 9,455.00 SAR',
+    'SADAD Bill Payment STC 1234-5678-90',
+    'Ref 2024/01/0A',
+    'Closing Balance 9,224.50 SAR',
+    'اسم العميل: محمد عبدالله القحطاني',
+    'رقم الحساب: 123456789012',
+    'خلال الفترة 2024/01/01 - 2024/01/31',
+    'رصيد الحساب الافتتاحي 1,000.00 ريال',
+    'شراء عبر نقاط البيع بنده الرياض',
+    '955.00 ر.س',
+    'حوالة واردة راتب 8,500.00 SR',
+    '',
+]
+
+
+def legacy_extract_date(date_patterns, text):
+    """extract_date_from_text before the date patterns were compiled: split on each separator and int() the parts"""
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        for pattern_config in date_patterns:
+            for separator in pattern_config.get("separators", ["/", "-"]):
+                if separator in line:
+                    parts = line.split(separator)
+                    if len(parts) >= 3:
+                        try:
+                            year = int(parts[pattern_config.get("year_position", 0)])
+                            month = int(parts[pattern_config.get("month_position", 1)])
+                            day = int(parts[pattern_config.get("day_position", 2)])
+                            if 1900 <= year <= 2100 and 1 <= month <= 12 and 1 <= day <= 31:
+                                return (year, month, day)
+                        except (ValueError, IndexError):
+                            continue
+    return None
+
+
+class DateLineRegexTests(SimpleTestCase):
+    """Compiled date patterns accept exactly the lines the split-and-int() parser did"""
+
+    def test_default_patterns_match_legacy_parser(self):
+        extractor = BankStatementExtractor()
+        date_patterns = extractor.config['date_patterns']
+        for line in STATEMENT_LINES:
+            with self.subTest(line=line):
+                self.assertEqual(extractor.extract_date_from_text(line), legacy_extract_date(date_patterns, line))
+        self.assertEqual(extractor.extract_date_from_line('09/01/2024'), (2024, 1, 9))
+
+    def test_custom_patterns_match_legacy_parser(self):
+        extractor = BankStatementExtractor()
+        extractor.config['date_patterns'] = [
+            {"separators": [".", "-"], "year_position": 2, "month_position": 0, "day_position": 1},
+        ]
+        extractor.compile_config_patterns()
+        lines = STATEMENT_LINES + ['01.31.2024', '12-25-2023', '01.31.2024.extra', '1.2']
+        for line in lines:
+            with self.subTest(line=line):
+                self.assertEqual(
+                    extractor.extract_date_from_text(line),
+                    legacy_extract_date(extractor.config['date_patterns'], line),
+                )
+
+    def test_page_text_returns_first_date_line(self):
+        page = '\n'.join(STATEMENT_LINES)
+        extractor = BankStatementExtractor()
+        self.assertEqual(extractor.extract_date_from_text(page), (2024, 1, 3))
+        self.assertEqual(
+            extractor.extract_date_from_text(page),
+            legacy_extract_date(extractor.config['date_patterns'], page),
+        )
+
+
+def legacy_field_values(patterns, text, field_name):
+    """extract_field_value and extract_field_value_different before labels were combined into one regex"""
+    first = second = None
+    for keyword in patterns.get(field_name, []):
+        regex = re.compile(rf'{re.escape(keyword)}\s*[:\s]*([^\n\r]+)', re.MULTILINE | re.IGNORECASE)
+        matches = regex.findall(text)
+        if matches:
+            if first is None:
+                first = re.sub(r'\s+', ' ', matches[0].strip())
+            if second is None:
+                second = re.sub(r'\s+', ' ', matches[min(len(matches), 2) - 1].strip())
+    return first, second
+
+
+class FieldRegexTests(SimpleTestCase):
+    """One combined label regex per field finds the same values as trying each label in priority order"""
+
+    TEXTS = [
+        '\n'.join(STATEMENT_LINES),
+        # Lower-priority labels ahead of the preferred ones, and repeated headers on a second page
+        'IBAN SA03 8000 0000 6080 1016 7519\nPeriod: January 2024\nIBAN Number: SA44 2000 0001 2345 6789 1234\n'
+        'On The Period 2024/01/01 - 2024/01/31\nAccount Holder  ALI  SALEH\nCustomer Name: ALI SALEH ALHARBI',
+        'Customer Name: ALI SALEH\nCity: Riyadh\n\nCustomer Name: ALI SALEH ALHARBI\ncity : Jeddah',
+        'رقم الآيبان: SA44 2000 0001 2345 6789 1234\nالمدينة: الرياض\nIBAN SA03 8000\nرقم حساب 555\nرقم الحساب 777',
+        'Statement without labels\n2024/01/03\n-45.00 SAR',
+        '',
+    ]
+
+    def test_fields_match_per_label_search(self):
+        extractor = BankStatementExtractor()
+        for language, patterns in (('english', extractor.english_patterns), ('arabic', extractor.arabic_patterns)):
+            for text in self.TEXTS:
+                for field_name in patterns:
+                    with self.subTest(language=language, field=field_name, text=text[:40]):
+                        self.assertEqual(
+                            (
+                                extractor.extract_field_value(text, field_name, language),
+                                extractor.extract_field_value_different(text, field_name, language),
+                            ),
+                            legacy_field_values(patterns, text, field_name),
+                        )
+
+    def test_priority_label_wins_over_earlier_label(self):
+        extractor = BankStatementExtractor()
+        text = self.TEXTS[1]
+        self.assertEqual(extractor.extract_field_value(text, 'iban_number', 'english'), 'SA44 2000 0001 2345 6789 1234')
+        self.assertEqual(extractor.extract_field_value(text, 'financial_period', 'english'), '2024/01/01 - 2024/01/31')
+
+
+def legacy_remove_dates(text):
+    """remove_dates_from_text before it used DATE_WORD_RE: drop words of three /- separated digit runs"""
+    filtered_words = []
+    for word in text.split():
+        if '/' in word or '-' in word:
+            parts = word.replace('/', '-').split('-')
+            if len(parts) == 3 and all(part.isdigit() for part in parts):
+                continue
+        filtered_words.append(word)
+    return ' '.join(filtered_words)
+
+
+class RemoveDatesTests(SimpleTestCase):
+    """DATE_WORD_RE drops the same words as the per-word split"""
+
+    def test_matches_per_word_split(self):
+        extractor = BankStatementExtractor()
+        texts = STATEMENT_LINES + [
+            '\n'.join(STATEMENT_LINES),
+            '2024/01/03 POS Purchase\tPANDA 03-01-2024 RIYADH',
+            'Transfer 2024/01/03/04 ref 12-34 to 2024-01/05 and 1--2 or /01/03 -2024-01-03',
+            'Refund 2024/01/03, card 4321 on ٢٠٢٤/٠١/١٥',
+        ]
+        for text in texts:
+            with self.subTest(text=text[:40]):
+                self.assertEqual(extractor.remove_dates_from_text(text), legacy_remove_dates(text))
+
+
+def legacy_detect_amounts(text, currency_symbols):
+    """detect_amounts_in_text before amount_hint_regex: a currency symbol, or a word of 3+ digits without ,.-"""
+    if any(currency in text for currency in currency_symbols):
+        return True
+    for word in text.split():
+        clean_word = word.replace(',', '').replace('.', '').replace('-', '')
+        if clean_word.isdigit() and len(clean_word) >= 3:
+            return True
+    return False
+
+
+class AmountHintTests(SimpleTestCase):
+    """amount_hint_regex flags the same search windows as the symbol check and per-word digit test"""
+
+    def test_matches_legacy_detection(self):
+        extractor = BankStatementExtractor()
+        texts = STATEMENT_LINES + [
+            '\n'.join(STATEMENT_LINES),
+            '2024/01/03\nPOS Purchase PANDA RIYADH',
+            'Fee 12.5 only',
+            'Card ending 4321',
+            'Amount -1,000.00',
+            'Ref 1.2.3 and 12-3',
+            'Ref AB123 and 12a3',
+            '..--,,',
+        ]
+        for symbols in (extractor.currency_symbols, ('SAR',), ()):
+            for text in texts:
+                with self.subTest(symbols=symbols, text=text[:40]):
+                    self.assertEqual(
+                        extractor.detect_amounts_in_text(text, symbols),
+                        legacy_detect_amounts(text, symbols),
+                    )
+
+
+STATEMENT_PAGE = """Customer Name: MOHAMMED A ALQAHTANI
+Opening Balance 1,000.00 SAR
+Date Description Debit Credit Balance
+2024/01/03
+POS Purchase PANDA RIYADH
+-45.00 SAR 0.00 SAR 955.00 SAR
+2024/01/05
+Incoming Transfer SALARY
+0.00 SAR 8,500.00 SAR 9,455.00 SAR
+2024/01/05
+Incoming Transfer SALARY
+0.00 SAR 8,500.00 SAR 9,455.00 SAR
+2024/01/09
+SADAD Bill Payment STC
+-230.50 SAR 0.00 SAR 9,224.50 SAR
+Closing Balance 9,224.50 SAR"""
+
+
+def legacy_dedup(transactions):
+    """Duplicate check before the set of keys: drop a transaction only when it repeats the one kept last"""
+    kept = []
+    for transaction in transactions:
+        if kept:
+            last = kept[-1]
+            if (last['date'] == transaction['date'] and last['description'] == transaction['description'] and
+                    abs(float(last['balance']) - float(transaction['balance'])) < 0.01):
+                continue
+        kept.append(transaction)
+    return kept
+
+
+class TransactionDedupTests(SimpleTestCase):
+    """Set-based duplicate detection keeps what the last-transaction check kept, and also drops later repeats"""
+
+    def candidates(self, pages):
+        counter = itertools.count()
+        with mock.patch.object(pdf_extractor, 'transaction_key', lambda transaction: next(counter)):
+            return BankStatementExtractor().extract_transactions(pages, 'english', False)
+
+    def test_adjacent_repeats_match_legacy_check(self):
+        # The same page twice, as when a page's text layer and OCR text are both extracted
+        for pages in ([STATEMENT_PAGE], [STATEMENT_PAGE, STATEMENT_PAGE]):
+            with self.subTest(pages=len(pages)):
+                transactions = BankStatementExtractor().extract_transactions(pages, 'english', False)
+                self.assertEqual(transactions, legacy_dedup(self.candidates(pages)))
+                self.assertEqual([t['balance'] for t in transactions], [955.0, 9455.0, 9455.0, 9224.5])
+
+    def test_non_adjacent_repeat_is_dropped(self):
+        # Two same-day rows, so the second copy of the page passes the date check and repeats non-adjacently
+        page = (
+            '2024/01/05\nIncoming Transfer SALARY\n0.00 SAR 8,500.00 SAR 9,455.00 SAR\n'
+            '2024/01/05\nPOS Purchase JARIR\n-120.00 SAR 0.00 SAR 9,335.00 SAR'
+        )
+        pages = [page, page]
+        candidates = self.candidates(pages)
+        self.assertEqual(len(legacy_dedup(candidates)), 4)
+        transactions = BankStatementExtractor().extract_transactions(pages, 'english', False)
+        self.assertEqual(transactions, candidates[:2])
+
+
+def legacy_cash_flow_stability(monthly_analysis):
+    """Net cash flow stability before Welford's update: two passes over the collected net changes"""
+    net_changes = [m['net_change'] for m in monthly_analysis.values() if m.get('net_change') is not None]
+    if len(net_changes) <= 1:
+        return 0
+    mean_net_change = sum(net_changes) / len(net_changes)
+    variance = sum((x - mean_net_change) ** 2 for x in net_changes) / (len(net_changes) - 1)
+    return variance ** 0.5 / mean_net_change if mean_net_change != 0 else 0
+
+
+class CashFlowStabilityTests(SimpleTestCase):
+    """Welford's online variance gives the two-pass STDEV / AVERAGE of monthly net change"""
+
+    NET_CHANGES = [
+        [8269.5, -1230.75, 455.0, -9100.0, 3120.4, 0.0],
+        [8269.5, None, -1230.75],
+        [1250000.01, 1250000.02, 1249999.99, 1250000.0],  # Large balances, tiny spread
+        [500.0, -500.0],  # Mean of zero
+        [42.0],
+        [],
+    ]
+
+    def test_matches_two_pass_variance(self):
+        extractor = BankStatementExtractor()
+        for net_changes in self.NET_CHANGES:
+            monthly_analysis = {
+                f'2024-{month:02d}': {'net_change': net_change, 'total_credit': 0, 'total_debit': 0}
+                for month, net_change in enumerate(net_changes, start=1)
+            }
+            with self.subTest(net_changes=net_changes):
+                expected = legacy_cash_flow_stability(monthly_analysis)
+                stability = extractor.calculate_analytics(monthly_analysis)['net_cash_flow_stability']
+                # Both are exact only to the inputs' rounding, which dominates when the spread is tiny
+                self.assertAlmostEqual(stability, expected, delta=abs(expected) * 1e-6)
+
+
+class ClaimForProcessingTests(TestCase):
+    """Only one job may own a pending upload until its claim goes stale"""
+
+    def setUp(self):
+        self.pdf_upload = PDFUpload.objects.create(file='pdfs/statement.pdf')
+
+    def test_claim_records_owner(self):
+        claimed = PDFUpload.claim_for_processing(self.pdf_upload.pk)
+        self.assertIsNotNone(claimed)
+        row = PDFUpload.objects.get(pk=self.pdf_upload.pk)
+        self.assertEqual(row.claimed_by, models.processing_worker_id())
+        self.assertEqual(row.claimed_at, claimed.claimed_at)
+
+    def test_live_claim_blocks_second_claim(self):
+        self.assertIsNotNone(PDFUpload.claim_for_processing(self.pdf_upload.pk))
+        self.assertIsNone(PDFUpload.claim_for_processing(self.pdf_upload.pk))
+
+    def test_stale_claim_is_taken_over(self):
+        stale_at = timezone.now() - timedelta(seconds=models.PROCESSING_LEASE_SECONDS + 60)
+        PDFUpload.objects.filter(pk=self.pdf_upload.pk).update(claimed_by='dead:1:1', claimed_at=stale_at)
+        claimed = PDFUpload.claim_for_processing(self.pdf_upload.pk)
+        self.assertIsNotNone(claimed)
+        self.assertEqual(claimed.claimed_by, models.processing_worker_id())
+
+    def test_takeover_before_shortens_the_lease(self):
+        claimed_at = timezone.now() - timedelta(minutes=1)
+        PDFUpload.objects.filter(pk=self.pdf_upload.pk).update(claimed_by='old:1:1', claimed_at=claimed_at)
+        self.assertIsNone(PDFUpload.claim_for_processing(self.pdf_upload.pk, takeover_before=claimed_at))
+        self.assertIsNotNone(PDFUpload.claim_for_processing(self.pdf_upload.pk, takeover_before=timezone.now()))
+
+    def test_finished_or_missing_upload_is_not_claimed(self):
+        PDFUpload.objects.filter(pk=self.pdf_upload.pk).update(processed=True)
+        self.assertIsNone(PDFUpload.claim_for_processing(self.pdf_upload.pk))
+        PDFUpload.objects.filter(pk=self.pdf_upload.pk).update(processed=False, processing_error='bad PDF')
+        self.assertIsNone(PDFUpload.claim_for_processing(self.pdf_upload.pk))
+        self.assertIsNone(PDFUpload.claim_for_processing(self.pdf_upload.pk + 1000))
+
+
+class ClaimFenceTests(TestCase):
+    """A job whose claim was taken over can no longer write the upload's row"""
+
+    def setUp(self):
+        pdf_upload = PDFUpload.objects.create(file='pdfs/statement.pdf')
+        self.job = PDFUpload.claim_for_processing(pdf_upload.pk)
+
+    def take_over(self):
+        PDFUpload.objects.filter(pk=self.job.pk).update(
+            claimed_at=timezone.now() - timedelta(seconds=models.PROCESSING_LEASE_SECONDS + 60)
+        )
+        with mock.patch.object(models, 'processing_worker_id', return_value='other-host:1:1'):
+            self.assertIsNotNone(PDFUpload.claim_for_processing(self.job.pk))
+
+    def test_claimed_row_follows_the_claim(self):
+        self.assertTrue(self.job.claimed_row().exists())
+        self.take_over()
+        self.assertFalse(self.job.claimed_row().exists())
+        self.assertEqual(self.job.claimed_row().update(processed=True), 0)
+        self.assertFalse(PDFUpload.objects.get(pk=self.job.pk).processed)
+
+    def test_error_is_recorded_only_while_claimed(self):
+        self.take_over()
+        self.assertFalse(views.record_processing_error(self.job, 'stale job failed'))
+        self.assertIsNone(PDFUpload.objects.get(pk=self.job.pk).processing_error)
+
+        self.job.claimed_by = 'other-host:1:1'
+        self.assertTrue(views.record_processing_error(self.job, 'PDF processing failed'))
+        self.assertEqual(PDFUpload.objects.get(pk=self.job.pk).processing_error, 'PDF processing failed')
+
+
+class StatusRows:
+    """Stand-in for the long-poll status queryset: first() returns the next (processed, processing_error) row"""
+
+    def __init__(self, *rows):
+        self.rows = list(rows)
+        self.reads = 0
+
+    def first(self):
+        self.reads += 1
+        return self.rows.pop(0) if len(self.rows) > 1 else self.rows[0]
+
+
+class LongPollTests(SimpleTestCase):
+    """wait_for_completion wakes on a local completion, notices remote ones per step, and cleans up its event"""
+
+    PENDING = (False, None)
+    DONE = (True, None)
+
+    def test_local_completion_wakes_waiter(self):
+        status_qs = StatusRows(self.PENDING, self.DONE)
+        timer = threading.Timer(0.2, views.signal_completion, args=(1,))
+        started = time.monotonic()
+        timer.start()
+        with mock.patch.object(views, 'LONG_POLL_STEP_SECONDS', 10):
+            self.assertEqual(views.wait_for_completion(1, status_qs, wait=10), self.DONE)
+        timer.join()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(status_qs.reads, 2)
+
+    def test_remote_completion_seen_on_next_step(self):
+        # Finished by another process: no event is set, the next re-read sees it
+        status_qs = StatusRows(self.PENDING, self.PENDING, self.DONE)
+        with mock.patch.object(views, 'LONG_POLL_STEP_SECONDS', 0.05):
+            self.assertEqual(views.wait_for_completion(2, status_qs, wait=10), self.DONE)
+        self.assertEqual(status_qs.reads, 3)
+
+    def test_returns_at_deadline_and_on_error_or_delete(self):
+        with mock.patch.object(views, 'LONG_POLL_STEP_SECONDS', 0.05):
+            self.assertEqual(views.wait_for_completion(3, StatusRows(self.PENDING), wait=0.2), self.PENDING)
+        self.assertEqual(views.wait_for_completion(3, StatusRows((False, 'bad PDF')), wait=10), (False, 'bad PDF'))
+        self.assertIsNone(views.wait_for_completion(3, StatusRows(None), wait=10))
+
+    def test_events_are_dropped_after_waiting(self):
+        with mock.patch.object(views, 'LONG_POLL_STEP_SECONDS', 0.05):
+            views.wait_for_completion(4, StatusRows(self.PENDING), wait=0.1)
+        views.wait_for_completion(5, StatusRows(self.DONE), wait=10)
+        self.assertNotIn(4, views._completion_events)
+        self.assertNotIn(5, views._completion_events)
+
+
+class AuthenticatedTestCase(TestCase):
+    """TestCase whose client holds an authenticated session"""
+
+    def setUp(self):
+        session = self.client.session
+        session['authenticated'] = True
+        session.save()
+
+
+class PdfProgressTests(AuthenticatedTestCase):
+    """get_pdf_progress serves cached page progress and falls back to the status and checkpoint columns"""
+
+    def progress(self, pdf_upload_id):
+        response = self.client.get(reverse('get_pdf_progress', args=[pdf_upload_id]))
+        return response.status_code, response.json()
+
+    def test_cached_progress(self):
+        pdf_upload = PDFUpload.objects.create(file='pdfs/statement.pdf')
+        with mock.patch.object(views, 'cached_pdf_progress', return_value=(3, 12)):
+            self.assertEqual(self.progress(pdf_upload.pk), (200, {
+                'id': pdf_upload.pk, 'status': 'processing', 'current_page': 3, 'total_pages': 12,
+            }))
+
+    def test_fallback_to_checkpoint(self):
+        queued = PDFUpload.objects.create(file='pdfs/statement.pdf')
+        checkpointed = PDFUpload.objects.create(
+            file='pdfs/statement.pdf', page_texts_file='page_texts/pdf_1.ndjson', current_page=4,
+        )
+        finished = PDFUpload.objects.create(file='pdfs/statement.pdf', processed=True, pages_processed=12)
+        failed = PDFUpload.objects.create(file='pdfs/statement.pdf', processing_error='bad PDF')
+        with mock.patch.object(views, 'cached_pdf_progress', return_value=None):
+            self.assertEqual(self.progress(queued.pk)[1]['current_page'], None)
+            self.assertEqual(self.progress(checkpointed.pk), (200, {
+                'id': checkpointed.pk, 'status': 'processing', 'current_page': 5, 'total_pages': None,
+            }))
+            self.assertEqual(self.progress(finished.pk)[1], {
+                'id': finished.pk, 'status': 'completed', 'current_page': 12, 'total_pages': 12,
+            })
+            self.assertEqual(self.progress(failed.pk)[1]['status'], 'error')
+            self.assertEqual(self.progress(failed.pk + 1000)[0], 404)
+
+    def test_requires_authentication(self):
+        self.client.cookies.clear()
+        self.assertEqual(self.progress(1)[0], 401)
+
+
+class PageTextsBufferTests(TestCase):
+    """The NDJSON resume buffer returns every checkpointed page, in order, on local disk and object storage"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def checkpoint(self, pdf_upload, pages):
+        superseded = pdf_upload.append_page_texts(pages)
+        pdf_upload.current_page = pages[-1][0]
+        pdf_upload.save(update_fields=['page_texts_file', 'current_page'])
+        return superseded
+
+    def test_local_buffer_appends_in_place(self):
+        pdf_upload = PDFUpload.objects.create(file='pdfs/statement.pdf')
+        self.assertIsNone(self.checkpoint(pdf_upload, [(0, 'Customer Name: ALI SALEH')]))
+        name = pdf_upload.page_texts_file.name
+        self.assertIsNone(self.checkpoint(pdf_upload, [(1, 'شراء عبر نقاط البيع\n955.00 SAR')]))
+        self.assertEqual(pdf_upload.page_texts_file.name, name)
+
+        resumed = PDFUpload.objects.get(pk=pdf_upload.pk)
+        self.assertEqual(resumed.current_page, 1)
+        self.assertEqual(resumed.load_page_texts(), ['Customer Name: ALI SALEH', 'شراء عبر نقاط البيع\n955.00 SAR'])
+        resumed.clear_page_texts()
+        self.assertEqual(resumed.load_page_texts(), [])
+
+    def test_object_storage_keeps_old_buffer_until_replaced(self):
+        storage = InMemoryStorage()
+        with mock.patch.object(PDFUpload._meta.get_field('page_texts_file'), 'storage', storage):
+            pdf_upload = PDFUpload.objects.create(file='pdfs/statement.pdf')
+            self.assertEqual(pdf_upload.page_checkpoint_interval(), settings.PAGE_CHECKPOINT_INTERVAL)
+            self.assertIsNone(self.checkpoint(pdf_upload, [(0, 'page 1')]))
+            first_name = pdf_upload.page_texts_file.name
+
+            superseded = self.checkpoint(pdf_upload, [(1, 'page 2'), (2, 'page 3')])
+            self.assertEqual(superseded, first_name)
+            self.assertNotEqual(pdf_upload.page_texts_file.name, first_name)
+            # Until the caller deletes it, the old object still holds the earlier checkpoint
+            self.assertTrue(storage.exists(first_name))
+            storage.delete(superseded)
+
+            resumed = PDFUpload.objects.get(pk=pdf_upload.pk)
+            self.assertEqual(resumed.page_texts_file.name, pdf_upload.page_texts_file.name)
+            self.assertEqual(resumed.load_page_texts(), ['page 1', 'page 2', 'page 3'])
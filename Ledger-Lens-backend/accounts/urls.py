@@ -13,6 +13,7 @@ urlpatterns = [
     path('upload/', views.upload_pdf, name='upload_pdf'),
     path('list/', views.list_pdf_uploads, name='list_pdf_uploads'),
     path('results/<int:pdf_id>/', views.get_pdf_results, name='get_pdf_results'),
+    path('progress/<int:pdf_id>/', views.get_pdf_progress, name='get_pdf_progress'),
     path('stop/<int:pdf_id>/', views.stop_pdf_processing, name='stop_pdf_processing'),
     path('delete/<int:pdf_id>/', views.delete_pdf_upload, name='delete_pdf_upload'),
 ] 
\ No newline at end of file
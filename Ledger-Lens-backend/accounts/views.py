@@ -7,19 +7,31 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.throttling import AnonRateThrottle
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from django.db import transaction
+from django.db import connection, connections, transaction
+import contextlib
+import csv
+import io
 import os
+import shutil
+import tempfile
+import hmac
 import json
 import threading
 import gc
 import logging
-from datetime import datetime
-from .models import PDFUpload, Transaction, PasscodeConfig
+import time
+from .models import (
+    PDFUpload, Transaction, PasscodeConfig,
+    ACCOUNT_SUMMARY_FIELDS, cancel_pdf_processing, forget_pdf_cancellation, cached_pdf_progress, clear_pdf_progress,
+    evict_extracted_texts,
+)
 from .pdf_extractor import BankStatementExtractor
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from django.utils import timezone
 from django.middleware.csrf import get_token
 from datetime import timedelta
+from decimal import Decimal
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -42,6 +54,12 @@ class AuthLoginResetThrottle(AnonRateThrottle):
     scope = 'auth_login_reset'
 
 
+class AuthLoginThrottle(AnonRateThrottle):
+    """Tighter per-IP bucket for passcode login: rejected in initial(), before the view touches the KDF.
+    The PasscodeConfig attempt lockout still applies globally as the last line of defense."""
+    scope = 'auth_login'
+
+
 class AuthStatusThrottle(AnonRateThrottle):
     scope = 'auth_status'
 
@@ -53,107 +71,197 @@ def get_csrf_token(request):
     return Response({'csrfToken': token}, status=status.HTTP_200_OK)
 
 
-# Helper to extract only the required fields for the frontend
-FRONTEND_FIELDS = [
-    'customer_name',
-    'account_number',
-    'iban_number',
-    'financial_period',
-    'opening_balance',
-    'closing_balance',
-    'pages_processed',
-    'total_transactions',
-]
-
-def get_frontend_result(pdf_upload):
-    account_info = pdf_upload.account_info or {}
-    return {
-        'customer_name': account_info.get('customer_name', ''),
-        'account_number': account_info.get('account_number', ''),
-        'iban_number': account_info.get('iban_number', ''),
-        'financial_period': account_info.get('financial_period', ''),
-        'opening_balance': account_info.get('opening_balance', 0),
-        'closing_balance': account_info.get('closing_balance', 0),
-        'pages_processed': pdf_upload.pages_processed,
-        'total_transactions': pdf_upload.total_transactions,
-    }
-
-def process_pdf_background(pdf_upload_id):
-    """Process PDF in background thread"""
-    start_time = datetime.now()
-    extractor = None
-    results = None
-    temp_file_path = None
+# Upload-list row: the account summary columns plus the extraction counts
+FRONTEND_FIELDS = ACCOUNT_SUMMARY_FIELDS + ('pages_processed', 'total_transactions')
+
+def get_frontend_result(row):
+    """Build one upload-list row from a values_list(*FRONTEND_FIELDS) tuple"""
+    return dict(zip(FRONTEND_FIELDS, row))
+
+TRANSACTION_BATCH_SIZE = getattr(django_settings, 'TRANSACTION_BATCH_SIZE', 1000)
+# Above this many rows, stream transactions with PostgreSQL COPY instead of ORM bulk_create
+TRANSACTION_COPY_THRESHOLD = 500
+TRANSACTION_COPY_COLUMNS = ('pdf_upload_id', 'date', 'description', 'debit', 'credit', 'balance')
+
+# The extractor only holds its config and compiled patterns, none of it changed per job, so one instance per
+# process serves every job and thread (built at import)
+EXTRACTOR = BankStatementExtractor()
+
+CENTS = Decimal('0.01')
+ZERO_AMOUNT = Decimal('0.00')
+
+def transaction_amount(value):
+    """Extractor amounts are floats (0/None when absent); convert once, via str() so 0.1 stays 0.1, at the column's scale"""
+    return Decimal(str(value)).quantize(CENTS) if value else ZERO_AMOUNT
+
+def transaction_date(extractor, raw_date):
+    """Extractor dates come as (y, m, d) tuples or YYYY/MM/DD-style strings; store them as a date"""
+    parsed = extractor.date_to_datetime(raw_date) if raw_date else None
+    return parsed.date() if parsed else None
+
+# Long-poll support: get_pdf_results?wait=N re-reads the status row every LONG_POLL_STEP_SECONDS until the PDF
+# finishes, so completions in any process (e.g. the Celery worker) are seen; a completion in this process also
+# sets a per-PDF event that wakes its waiters at once. At most LONG_POLL_MAX_WAITERS requests wait at a time
+# (each holds a gunicorn thread); beyond that ?wait is answered like a plain poll.
+LONG_POLL_MAX_SECONDS = 25
+LONG_POLL_STEP_SECONDS = 2
+LONG_POLL_MAX_WAITERS = 4
+_long_poll_slots = threading.BoundedSemaphore(LONG_POLL_MAX_WAITERS)
+_completion_events = {}  # pdf_upload_id -> [Event, number of requests waiting on it]
+_completion_events_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def completion_event(pdf_upload_id):
+    """The PDF's completion event for the duration of one wait; the entry is dropped when its last waiter leaves"""
+    with _completion_events_lock:
+        entry = _completion_events.setdefault(pdf_upload_id, [threading.Event(), 0])
+        entry[1] += 1
     try:
-        logger.info(f"[PDF {pdf_upload_id}] Background processing started at {start_time}")
-        
-        # Immediate check: Verify PDF still exists
-        try:
-            pdf_upload = PDFUpload.objects.get(id=pdf_upload_id)
-        except PDFUpload.DoesNotExist:
-            logger.info(f"[PDF {pdf_upload_id}] PDF deleted before processing started, stopping")
-            return
+        yield entry[0]
+    finally:
+        with _completion_events_lock:
+            entry[1] -= 1
+            if entry[1] == 0 and _completion_events.get(pdf_upload_id) is entry:
+                del _completion_events[pdf_upload_id]
+
+
+def signal_completion(pdf_upload_id):
+    with _completion_events_lock:
+        entry = _completion_events.pop(pdf_upload_id, None)
+    if entry:
+        entry[0].set()
+
+
+def wait_for_completion(pdf_upload_id, status_qs, wait):
+    """Re-read status_qs (processed, processing_error first) until the upload is finished or gone, or wait
+    seconds pass; returns the last row read"""
+    deadline = time.monotonic() + wait
+    with completion_event(pdf_upload_id) as event:
+        while True:
+            # Read after the event is registered, so a completion in this process just before is not missed
+            status_row = status_qs.first()
+            remaining = deadline - time.monotonic()
+            if status_row is None or status_row[0] or status_row[1] or remaining <= 0:
+                return status_row
+            event.wait(timeout=min(LONG_POLL_STEP_SECONDS, remaining))
+
+def insert_transactions(pdf_upload, transactions_data, extractor):
+    """Persist extracted transactions; large statements skip ORM object construction via COPY. Returns row count."""
+    if connection.vendor == 'postgresql' and len(transactions_data) > TRANSACTION_COPY_THRESHOLD:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for t in transactions_data:
+            writer.writerow((
+                pdf_upload.id,
+                transaction_date(extractor, t.get('date')) or '',  # Unquoted empty field is NULL in COPY csv (date only)
+                t.get('description', ''),
+                transaction_amount(t.get('debit')),
+                transaction_amount(t.get('credit')),
+                transaction_amount(t.get('balance')),
+            ))
+        buf.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {Transaction._meta.db_table} ({', '.join(TRANSACTION_COPY_COLUMNS)}) FROM STDIN "
+                "WITH (FORMAT csv, FORCE_NOT_NULL (description))",
+                buf,
+            )
+        return len(transactions_data)
+    objs = [
+        Transaction(
+            pdf_upload=pdf_upload,
+            date=transaction_date(extractor, t.get('date')),
+            description=t.get('description', ''),
+            debit=transaction_amount(t.get('debit')),
+            credit=transaction_amount(t.get('credit')),
+            balance=transaction_amount(t.get('balance')),
+        )
+        for t in transactions_data
+    ]
+    Transaction.objects.bulk_create(objs, batch_size=TRANSACTION_BATCH_SIZE)
+    return len(objs)
+
+# Storage backend is fixed per deployment; resolve it once (LazyObject proxies __class__ to the wrapped storage)
+IS_S3_STORAGE = hasattr(default_storage, 'bucket_name') or 's3' in default_storage.__class__.__name__.lower()
+
+@contextlib.contextmanager
+def staged_pdf(pdf_upload):
+    """Yield a local path to the upload's PDF. Local storage yields the file in place; S3 (Supabase Storage,
+    no .path support) is streamed in 1 MiB chunks into a temp dir that is removed on exit, error or not."""
+    if not IS_S3_STORAGE:
+        yield pdf_upload.file.path
+        return
+    with tempfile.TemporaryDirectory(prefix=f'pdf_{pdf_upload.id}_') as temp_dir:
+        file_path = os.path.join(temp_dir, 'statement.pdf')
+        with pdf_upload.file.open('rb') as src, open(file_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+        logger.info(f"[PDF {pdf_upload.id}] Downloaded from Supabase Storage to temp file: {file_path}")
+        yield file_path
+
+def record_processing_error(pdf_upload, error):
+    """Store a job failure while the job still holds its claim, dropping the page-text buffer (errored uploads are
+    never resumed). Returns False when the upload was deleted or another worker has taken it over."""
+    with transaction.atomic():
+        row = pdf_upload.claimed_row().select_for_update().only('id', 'page_texts_file').first()
+        if row is None:
+            logger.warning("[PDF %s] Claim taken over or upload deleted; not recording error", pdf_upload.pk)
+            return False
+        row.processing_error = error
+        row.clear_page_texts()
+        row.current_page = 0
+        row.save(update_fields=['processing_error', 'page_texts_file', 'current_page'])
+    return True
+
+# Jobs above this many pages leave enough garbage behind to be worth a full gc.collect()
+GC_COLLECT_MIN_PAGES = 50
+
+def process_pdf_background(pdf_upload_id, takeover_before=None):
+    """Process PDF in a Celery worker (accounts.tasks.process_pdf_task) or background thread.
+    takeover_before: treat an existing claim older than this as abandoned (see PDFUpload.claim_for_processing)."""
+    start_time = time.perf_counter()
+    pdf_upload = None
+    try:
+        logger.info(f"[PDF {pdf_upload_id}] Background processing started")
         
-        # Check if already processed (thread safety)
-        if pdf_upload.processed:
-            logger.info(f"[PDF {pdf_upload_id}] Already processed, skipping")
+        # Single atomic claim replaces the exists/processed read-then-act checks
+        pdf_upload = PDFUpload.claim_for_processing(pdf_upload_id, takeover_before=takeover_before)
+        if pdf_upload is None:
+            logger.info(f"[PDF {pdf_upload_id}] Deleted, already processed, or running in another worker; skipping")
             return
         
-        # Get file path (works with both local and Supabase Storage)
-        # Check storage type - S3 storage doesn't support .path attribute
-        from django.core.files.storage import default_storage
-        is_s3_storage = hasattr(default_storage, 'bucket_name') or 's3' in str(type(default_storage)).lower()
-        
-        if is_s3_storage:
-            # Supabase Storage (S3) - download to temp file
-            import tempfile
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-            temp_file.write(pdf_upload.file.read())
-            temp_file.close()
-            file_path = temp_file.name
-            temp_file_path = file_path  # Store for cleanup
-            logger.info(f"[PDF {pdf_upload_id}] Downloaded from Supabase Storage to temp file: {file_path}")
-        else:
-            # Local filesystem
-            file_path = pdf_upload.file.path
-        
-        logger.info(f"[PDF {pdf_upload_id}] File path: {file_path}")
-        
         # Check for existing progress (resume from last page)
+        # load_page_texts() returns a fresh list owned by this job; the extractor appends to it in place, no copy needed
         start_page = 0
-        existing_text = []
-        if pdf_upload.extracted_text_pages and len(pdf_upload.extracted_text_pages) > 0:
-            start_page = pdf_upload.current_page + 1
-            existing_text = pdf_upload.extracted_text_pages.copy()
+        existing_text = pdf_upload.load_page_texts()
+        if existing_text:
+            start_page = len(existing_text)
             logger.info(f"[PDF {pdf_upload_id}] Resuming from page {start_page + 1}, {len(existing_text)} pages already extracted")
         else:
             logger.info(f"[PDF {pdf_upload_id}] Starting PDF extraction from beginning...")
         
-        # Check before extraction: Verify PDF still exists
-        try:
-            PDFUpload.objects.get(id=pdf_upload_id)
-        except PDFUpload.DoesNotExist:
-            logger.info(f"[PDF {pdf_upload_id}] PDF deleted before extraction started, stopping")
-            return
-        
-        extractor = BankStatementExtractor()
-        logger.info(f"[PDF {pdf_upload_id}] Extractor initialized, calling process_bank_statement...")
+        extractor = EXTRACTOR
+        logger.info(f"[PDF {pdf_upload_id}] Calling process_bank_statement...")
         
-        # Pass pdf_upload_id, start_page, and existing_text for resume
-        results = extractor.process_bank_statement(file_path, pdf_upload_id, start_page, existing_text)
+        # Local path for the extractor (S3 objects are staged in a temp dir that is removed on exit)
+        with staged_pdf(pdf_upload) as file_path:
+            logger.info(f"[PDF {pdf_upload_id}] File path: {file_path}")
+            # Pass pdf_upload_id, start_page, and existing_text for resume; claimed_by fences the checkpoints
+            results = extractor.process_bank_statement(
+                file_path, pdf_upload_id, start_page, existing_text, claimed_by=pdf_upload.claimed_by,
+            )
         
         # Check if processing was stopped (PDF deleted)
         if results and 'error' in results and results['error'] == "PDF processing stopped":
             logger.info(f"[PDF {pdf_upload_id}] Processing stopped - PDF deleted during extraction")
             return
         
-        elapsed = (datetime.now() - start_time).total_seconds()
+        elapsed = time.perf_counter() - start_time
         logger.info(f"[PDF {pdf_upload_id}] PDF extraction completed in {elapsed:.2f} seconds")
         
         if not results or 'error' in results:
             logger.error(f"[PDF {pdf_upload_id}] Extraction error: {results['error']}")
-            pdf_upload.processing_error = results['error']
-            pdf_upload.save()
+            record_processing_error(pdf_upload, results['error'])
             return
         
         # Log extraction results
@@ -171,85 +279,91 @@ def process_pdf_background(pdf_upload_id):
         logger.info(f"[PDF {pdf_upload_id}] Saving results to database...")
         pdf_upload.processed = True
         pdf_upload.account_info = results.get('account_info', {})
+        pdf_upload.set_account_summary(pdf_upload.account_info)
         pdf_upload.total_transactions = total_transactions
         pdf_upload.pages_processed = pages_processed
         pdf_upload.monthly_analysis = results.get('monthly_analysis', {})
         # Store analytics in account_info for easy access
         if analytics:
             pdf_upload.account_info['analytics'] = analytics
-        # Clear progress tracking fields on completion
-        pdf_upload.extracted_text_pages = []
+        # Clear progress tracking fields on completion; the buffer file itself is deleted once the results commit
+        # (the extractor created it on its own instance, so read the name back from the row)
+        page_texts_name = PDFUpload.objects.filter(pk=pdf_upload.pk).values_list('page_texts_file', flat=True).first()
+        pdf_upload.page_texts_file = None
         pdf_upload.current_page = 0
-        pdf_upload.save()
-        logger.info(f"[PDF {pdf_upload_id}] Results saved to database")
         
-        # Create transaction records in batches (bulk_create)
+        # Results row and transactions commit together (only this write phase, never the
+        # extraction, runs in a transaction): pollers never see processed=True with a missing ledger
         transactions_data = results.get('transactions', [])
         logger.info("[PDF %s] Creating %s transaction records (bulk)...", pdf_upload_id, len(transactions_data))
-        BATCH_SIZE = 500
-        transaction_count = 0
-        for i in range(0, len(transactions_data), BATCH_SIZE):
-            batch = transactions_data[i:i + BATCH_SIZE]
-            objs = [
-                Transaction(
-                    pdf_upload=pdf_upload,
-                    date=t.get('date', ''),
-                    description=t.get('description', ''),
-                    debit=t.get('debit', 0),
-                    credit=t.get('credit', 0),
-                    balance=t.get('balance', 0),
-                )
-                for t in batch
-            ]
-            Transaction.objects.bulk_create(objs)
-            transaction_count += len(objs)
+        with transaction.atomic():
+            # Fence: write only while this job still holds the claim (a worker that took it over owns the row now)
+            if not pdf_upload.claimed_row().select_for_update().exists():
+                logger.warning("[PDF %s] Claim taken over or upload deleted; discarding these results", pdf_upload_id)
+                return
+            pdf_upload.save(update_fields=[
+                'processed', 'account_info', *ACCOUNT_SUMMARY_FIELDS, 'total_transactions', 'pages_processed',
+                'monthly_analysis', 'page_texts_file', 'current_page',
+            ])
+            transaction_count = insert_transactions(pdf_upload, transactions_data, extractor)
+        if page_texts_name:
+            pdf_upload.page_texts_file.storage.delete(page_texts_name)
+        logger.info(f"[PDF {pdf_upload_id}] Results saved to database")
         logger.info("[PDF %s] All %s transactions created", pdf_upload_id, transaction_count)
         
-        total_elapsed = (datetime.now() - start_time).total_seconds()
+        total_elapsed = time.perf_counter() - start_time
         logger.info(f"[PDF {pdf_upload_id}] Processing completed successfully in {total_elapsed:.2f} seconds")
         
-        # Memory cleanup: explicitly delete large objects
-        del results
-        del analytics
-        if extractor:
-            del extractor
-        
-        # Force garbage collection to free memory
-        gc.collect()
-        logger.info(f"[PDF {pdf_upload_id}] Memory cleaned up")
-        
-        # Cleanup temp file if used (Supabase Storage)
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-                logger.info(f"[PDF {pdf_upload_id}] Temp file deleted: {temp_file_path}")
-            except Exception as cleanup_error:
-                logger.warning(f"[PDF {pdf_upload_id}] Failed to delete temp file: {cleanup_error}")
+        # Large refs (results, page texts) drop when this returns; only pay for a full collection after big jobs
+        if pages_processed > GC_COLLECT_MIN_PAGES:
+            gc.collect()
+            logger.info(f"[PDF {pdf_upload_id}] Memory cleaned up")
     except Exception as e:
-        elapsed = (datetime.now() - start_time).total_seconds()
+        elapsed = time.perf_counter() - start_time
         logger.error(f"[PDF {pdf_upload_id}] ERROR after {elapsed:.2f} seconds: {str(e)}", exc_info=True)
         try:
-            pdf_upload = PDFUpload.objects.get(id=pdf_upload_id)
-            pdf_upload.processing_error = str(e)
-            pdf_upload.save()
-            logger.error(f"[PDF {pdf_upload_id}] Error saved to database")
+            # Without a claim (it failed before one was taken) there is nothing this job may write
+            if pdf_upload is not None and record_processing_error(pdf_upload, str(e)):
+                logger.error(f"[PDF {pdf_upload_id}] Error saved to database")
         except Exception as save_error:
             logger.error(f"[PDF {pdf_upload_id}] Failed to save error: {str(save_error)}")
-        finally:
-            # Cleanup in case of error
-            if results:
-                del results
-            if extractor:
-                del extractor
-            # Cleanup temp file if used (Supabase Storage)
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                    logger.info(f"[PDF {pdf_upload_id}] Temp file deleted after error: {temp_file_path}")
-                except Exception as cleanup_error:
-                    logger.warning(f"[PDF {pdf_upload_id}] Failed to delete temp file after error: {cleanup_error}")
-            gc.collect()
-            logger.info(f"[PDF {pdf_upload_id}] Cleanup completed after error")
+    finally:
+        forget_pdf_cancellation(pdf_upload_id)
+        if pdf_upload is not None:
+            clear_pdf_progress(pdf_upload_id)
+        # Wake any long-polling get_pdf_results requests
+        signal_completion(pdf_upload_id)
+
+def delete_stored_files(names):
+    """Delete files from default storage in parallel (S3 deletes are latency-bound); failures are logged, not raised"""
+    def delete_one(name):
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.warning(f"Error deleting {name} from storage: {str(e)}")
+
+    if not names:
+        return
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(delete_one, names))
+
+def process_pdf_in_thread(pdf_upload_id, takeover_before=None):
+    """Thread target: Django never closes connections opened outside a request, so close this thread's on exit"""
+    try:
+        process_pdf_background(pdf_upload_id, takeover_before)
+    finally:
+        connections.close_all()
+
+def start_pdf_processing(pdf_upload_id, takeover_before=None):
+    """Hand a PDF to the Celery 'pdf' queue when a broker is configured, else to a daemon thread (local dev)"""
+    if getattr(django_settings, 'CELERY_BROKER_URL', ''):
+        from .tasks import process_pdf_task
+        result = process_pdf_task.delay(pdf_upload_id)
+        logger.info(f"[PDF {pdf_upload_id}] Queued for processing, task ID: {result.id}")
+        return
+    thread = threading.Thread(target=process_pdf_in_thread, args=(pdf_upload_id, takeover_before), daemon=True)
+    thread.start()
+    logger.info(f"[PDF {pdf_upload_id}] Background thread started, thread ID: {thread.ident}")
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
@@ -285,22 +399,18 @@ def upload_pdf(request):
 
         # Clear all pending PDFs and their data before uploading new one
         logger.info("Clearing all pending PDF uploads and storage...")
-        pending_pdfs = PDFUpload.objects.filter(processed=False)
-        pending_count = pending_pdfs.count()
-        logger.info(f"Found {pending_count} pending PDF(s) to delete")
-        
-        with transaction.atomic():
-            for pdf_upload in pending_pdfs:
-                # Delete file from storage (S3 or local)
-                if pdf_upload.file:
-                    try:
-                        pdf_upload.file.delete(save=False)
-                        logger.info(f"[PDF {pdf_upload.id}] File deleted from storage")
-                    except Exception as e:
-                        logger.warning(f"[PDF {pdf_upload.id}] Error deleting file: {str(e)}")
-                # Delete the PDF upload record (transactions deleted via CASCADE)
-                pdf_upload.delete()
-                logger.info(f"[PDF {pdf_upload.id}] PDF upload record deleted")
+        pending_rows = list(PDFUpload.objects.filter(processed=False).values_list('id', 'file', 'page_texts_file'))
+        logger.info(f"Found {len(pending_rows)} pending PDF(s) to delete")
+        cancel_pdf_processing(*[row[0] for row in pending_rows])
+        evict_extracted_texts(*[row[0] for row in pending_rows])
+        
+        # Single DELETE ... WHERE id IN (...) over exactly the rows whose files we collected; transactions go via CASCADE
+        _, deleted_per_model = PDFUpload.objects.filter(id__in=[row[0] for row in pending_rows]).delete()
+        pending_count = deleted_per_model.get(PDFUpload._meta.label, 0)
+        # Then remove their PDFs and page text buffers from storage (S3 or local)
+        delete_stored_files([name for _, *names in pending_rows for name in names if name])
+        for pending_id, _, _ in pending_rows:
+            signal_completion(pending_id)
         
         logger.info(f"Cleared {pending_count} pending PDF(s) and their data")
         
@@ -315,14 +425,11 @@ def upload_pdf(request):
         # Thread safety: Check if already processed before starting thread
         # (This prevents duplicate processing if upload endpoint is called multiple times)
         if not pdf_upload.processed:
-            logger.info(f"[PDF {pdf_upload.id}] Starting background processing thread...")
-            # Start background processing
-            thread = threading.Thread(target=process_pdf_background, args=(pdf_upload.id,))
-            thread.daemon = True
-            thread.start()
-            logger.info(f"[PDF {pdf_upload.id}] Background thread started, thread ID: {thread.ident}")
+            logger.info(f"[PDF {pdf_upload.id}] Starting background processing...")
+            # Start background processing (Celery worker, or a thread when no broker is configured)
+            start_pdf_processing(pdf_upload.id)
         else:
-            logger.warning(f"[PDF {pdf_upload.id}] Already processed, skipping thread start")
+            logger.warning(f"[PDF {pdf_upload.id}] Already processed, skipping background processing")
         
         # Return immediately with PDF ID for polling
         logger.info(f"[PDF {pdf_upload.id}] Returning 202 Accepted response to client")
@@ -341,56 +448,83 @@ def upload_pdf(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+
+PDF_STATUS_FIELDS = ('processed', 'processing_error', 'pages_processed', 'total_transactions', 'uploaded_at')
+
+
 @api_view(['GET'])
 @require_authentication
 def get_pdf_results(request, pdf_id):
-    """Get PDF processing results - returns full data when processed, status when processing"""
+    """Get PDF processing results - returns full data when processed, status when processing.
+    Optional ?wait=<seconds> (max 25) holds a still-processing request until processing finishes or the wait ends
+    (answered at once when LONG_POLL_MAX_WAITERS requests are already waiting)."""
     try:
-        logger.info(f"[PDF {pdf_id}] Polling request received from client")
-        pdf_upload = PDFUpload.objects.get(id=pdf_id)
+        wait = min(LONG_POLL_MAX_SECONDS, max(0.0, float(request.query_params.get('wait', 0))))
+    except (ValueError, TypeError):
+        return Response(
+            {'error': 'Invalid wait.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        logger.debug("[PDF %s] Polling request received from client", pdf_id)
+        # Polls only need the status columns, read as a plain tuple; the result JSON is fetched once the PDF is processed
+        status_qs = PDFUpload.objects.filter(id=pdf_id).values_list(*PDF_STATUS_FIELDS)
+        if wait and _long_poll_slots.acquire(blocking=False):
+            try:
+                status_row = wait_for_completion(pdf_id, status_qs, wait)
+            finally:
+                _long_poll_slots.release()
+        else:
+            status_row = status_qs.first()
+        if status_row is None:
+            raise PDFUpload.DoesNotExist
+        processed, processing_error, pages_processed, total_transactions, uploaded_at = status_row
         
         # Calculate time since upload
         time_since_upload = None
-        if pdf_upload.uploaded_at:
-            time_since_upload = (datetime.now() - pdf_upload.uploaded_at.replace(tzinfo=None)).total_seconds()
+        if uploaded_at:
+            time_since_upload = (timezone.now() - uploaded_at).total_seconds()
         
         # If already processed, return results immediately (thread safety)
-        if pdf_upload.processed:
-            logger.info(f"[PDF {pdf_id}] Status: COMPLETED (processed: {pdf_upload.pages_processed} pages, {pdf_upload.total_transactions} transactions, elapsed: {time_since_upload:.2f}s)")
-            account_info = pdf_upload.account_info or {}
-            account_info['pages_processed'] = pdf_upload.pages_processed
-            account_info['total_transactions'] = pdf_upload.total_transactions
+        if processed:
+            logger.info(f"[PDF {pdf_id}] Status: COMPLETED (processed: {pages_processed} pages, {total_transactions} transactions, elapsed: {time_since_upload:.2f}s)")
+            account_info, monthly_analysis = PDFUpload.objects.values_list('account_info', 'monthly_analysis').get(id=pdf_id)
+            account_info = account_info or {}
+            account_info['pages_processed'] = pages_processed
+            account_info['total_transactions'] = total_transactions
             analytics = account_info.pop('analytics', {})
             response_data = {
-                'id': pdf_upload.id,
+                'id': pdf_id,
                 'status': 'completed',
                 'account_info': account_info,
-                'monthly_analysis': pdf_upload.monthly_analysis or {},
+                'monthly_analysis': monthly_analysis or {},
                 'analytics': analytics
             }
             return Response(response_data, status=status.HTTP_200_OK)
         
         # If still processing, return status
-        if pdf_upload.processing_error:
-            logger.warning(f"[PDF {pdf_id}] Status: ERROR - {pdf_upload.processing_error} (elapsed: {time_since_upload:.2f}s)")
+        if processing_error:
+            logger.warning(f"[PDF {pdf_id}] Status: ERROR - {processing_error} (elapsed: {time_since_upload:.2f}s)")
             return Response(
                 {
-                    'id': pdf_upload.id,
+                    'id': pdf_id,
                     'status': 'error',
-                    'error': pdf_upload.processing_error
+                    'error': processing_error
                 },
                 status=status.HTTP_200_OK
             )
         
         # Still processing
-        logger.info(f"[PDF {pdf_id}] Status: PROCESSING (elapsed: {time_since_upload:.2f}s, processed: {pdf_upload.processed})")
+        logger.debug("[PDF %s] Status: PROCESSING (elapsed: %.2fs)", pdf_id, time_since_upload)
         return Response(
             {
-                'id': pdf_upload.id,
+                'id': pdf_id,
                 'status': 'processing',
                 'message': 'PDF is being processed. Please check again in a moment.'
             },
-            status=status.HTTP_200_OK
+            status=status.HTTP_200_OK,
+            # Lets the browser coalesce back-to-back polls from multiple tabs/components
+            headers={'Cache-Control': 'private, max-age=1'},
         )
     except PDFUpload.DoesNotExist:
         logger.warning(f"[PDF {pdf_id}] Polling request for non-existent PDF")
@@ -405,6 +539,47 @@ def get_pdf_results(request, pdf_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@require_authentication
+def get_pdf_progress(request, pdf_id):
+    """Pages extracted so far for a running PDF, served from the cache so clients can poll it often while
+    polling get_pdf_results only for completion. Falls back to the status and checkpoint columns when no progress is
+    cached (e.g. DummyCache); total_pages is then unknown while processing."""
+    progress = cached_pdf_progress(pdf_id)
+    if progress is not None:
+        current_page, total_pages = progress
+        return Response(
+            {'id': pdf_id, 'status': 'processing', 'current_page': current_page, 'total_pages': total_pages},
+            status=status.HTTP_200_OK,
+            headers={'Cache-Control': 'private, max-age=1'},
+        )
+    try:
+        status_row = PDFUpload.objects.filter(id=pdf_id).values_list(
+            'processed', 'processing_error', 'pages_processed', 'current_page', 'page_texts_file'
+        ).first()
+        if status_row is None:
+            return Response(
+                {'error': 'PDF upload not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        processed, processing_error, pages_processed, checkpoint_page, page_texts_file = status_row
+        if processed:
+            response_data = {'id': pdf_id, 'status': 'completed', 'current_page': pages_processed, 'total_pages': pages_processed}
+        elif processing_error:
+            response_data = {'id': pdf_id, 'status': 'error', 'current_page': None, 'total_pages': None}
+        else:
+            # current_page is the last checkpointed page (0-indexed), meaningful once a checkpoint wrote the buffer;
+            # before that the job is queued or on its first pages
+            current_page = checkpoint_page + 1 if page_texts_file else None
+            response_data = {'id': pdf_id, 'status': 'processing', 'current_page': current_page, 'total_pages': None}
+        return Response(response_data, status=status.HTTP_200_OK)
+    except Exception:
+        logger.exception("Error in get_pdf_progress for pdf_id=%s", pdf_id)
+        return Response(
+            {'error': 'An error occurred. Please try again.'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 DEFAULT_PAGE_SIZE = 20
 MAX_PAGE_SIZE = 100
 
@@ -417,10 +592,11 @@ def list_pdf_uploads(request):
         page_size = min(MAX_PAGE_SIZE, max(1, int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))))
         start = (page - 1) * page_size
         end = start + page_size
-        qs = PDFUpload.objects.all().order_by('-uploaded_at')
+        qs = PDFUpload.objects.order_by('-uploaded_at')  # served by the uploaded_at index
         total_count = qs.count()
-        page_qs = qs[start:end]
-        results = [get_frontend_result(pdf) for pdf in page_qs]
+        # Plain tuples of scalar columns: no model instances and no JSON columns at all
+        page_rows = qs.values_list(*FRONTEND_FIELDS)[start:end]
+        results = [get_frontend_result(row) for row in page_rows]
         has_next = end < total_count
         next_page = page + 1 if has_next else None
         return Response(
@@ -450,13 +626,17 @@ def stop_pdf_processing(request, pdf_id):
     try:
         logger.info(f"[PDF {pdf_id}] Stop processing request received")
         pdf_upload = PDFUpload.objects.get(id=pdf_id)
+        cancel_pdf_processing(pdf_id)
+        evict_extracted_texts(pdf_id)
         
         if pdf_upload.file:
             pdf_upload.file.delete(save=False)
             logger.info(f"[PDF {pdf_id}] PDF file deleted")
+        pdf_upload.clear_page_texts()
         
         pdf_upload.delete()
         logger.info(f"[PDF {pdf_id}] PDF upload record deleted")
+        signal_completion(pdf_id)
         
         return Response(
             {'message': 'PDF processing stopped and deleted successfully'}, 
@@ -480,9 +660,13 @@ def stop_pdf_processing(request, pdf_id):
 def delete_pdf_upload(request, pdf_id):
     try:
         pdf_upload = PDFUpload.objects.get(id=pdf_id)
+        cancel_pdf_processing(pdf_id)
+        evict_extracted_texts(pdf_id)
         if pdf_upload.file:
             pdf_upload.file.delete(save=False)
+        pdf_upload.clear_page_texts()
         pdf_upload.delete()
+        signal_completion(pdf_id)
         return Response(
             {'message': 'PDF upload deleted successfully'}, 
             status=status.HTTP_204_NO_CONTENT
@@ -501,8 +685,12 @@ def delete_pdf_upload(request, pdf_id):
 
 
 # Authentication views
+def constant_time_equals(given, expected):
+    """Compare secrets without leaking the matching prefix length through timing (bytes, so non-ASCII input is safe)"""
+    return hmac.compare_digest(given.encode('utf-8'), expected.encode('utf-8'))
+
 @api_view(['POST'])
-@throttle_classes([AuthLoginResetThrottle])
+@throttle_classes([AuthLoginResetThrottle, AuthLoginThrottle])
 def login_with_passcode(request):
     """Login with 6-digit passcode"""
     try:
@@ -526,6 +714,13 @@ def login_with_passcode(request):
                 status=status.HTTP_429_TOO_MANY_REQUESTS
             )
         
+        # Out of attempts but not (yet) locked, e.g. a concurrent failure is still writing the lock: skip the hash
+        if config.passcode_attempts >= django_settings.PASSCODE_MAX_ATTEMPTS:
+            return Response(
+                {'error': f'Too many failed attempts. Please wait {django_settings.PASSCODE_LOCKOUT_MINUTES} minutes.'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        
         # Check if expired
         if config.is_passcode_expired():
             return Response(
@@ -540,16 +735,14 @@ def login_with_passcode(request):
             return Response({'success': True, 'message': 'Login successful'})
         else:
             config.increment_passcode_attempts()
-            max_attempts = getattr(django_settings, 'PASSCODE_MAX_ATTEMPTS', 5)
-            remaining_attempts = max_attempts - config.passcode_attempts
+            remaining_attempts = django_settings.PASSCODE_MAX_ATTEMPTS - config.passcode_attempts
             if remaining_attempts > 0:
                 return Response(
                     {'error': f'Incorrect passcode. {remaining_attempts} attempts remaining.'},
                     status=status.HTTP_401_UNAUTHORIZED
                 )
-            lockout_min = getattr(django_settings, 'PASSCODE_LOCKOUT_MINUTES', 15)
             return Response(
-                {'error': f'Too many failed attempts. Please wait {lockout_min} minutes.'},
+                {'error': f'Too many failed attempts. Please wait {django_settings.PASSCODE_LOCKOUT_MINUTES} minutes.'},
                 status=status.HTTP_429_TOO_MANY_REQUESTS
             )
     except Exception:
@@ -602,26 +795,25 @@ def reset_passcode(request):
             )
         
         # Verify credentials (from settings; required in production)
-        admin_username = getattr(django_settings, 'ADMIN_USERNAME', None)
-        admin_password = getattr(django_settings, 'ADMIN_PASSWORD', None)
-        if not admin_username or not admin_password:
+        if not django_settings.ADMIN_USERNAME or not django_settings.ADMIN_PASSWORD:
             logger.warning("Admin credentials not configured")
             return Response(
                 {'error': 'Server misconfiguration. Please contact support.'},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
-        if username != admin_username or password != admin_password:
+        # Evaluate both comparisons so timing doesn't reveal which one failed
+        username_ok = constant_time_equals(username, django_settings.ADMIN_USERNAME)
+        password_ok = constant_time_equals(password, django_settings.ADMIN_PASSWORD)
+        if not (username_ok and password_ok):
             config.increment_creds_attempts()
-            max_attempts = getattr(django_settings, 'PASSCODE_MAX_ATTEMPTS', 5)
-            remaining_attempts = max_attempts - config.creds_attempts
+            remaining_attempts = django_settings.PASSCODE_MAX_ATTEMPTS - config.creds_attempts
             if remaining_attempts > 0:
                 return Response(
                     {'error': f'Invalid username or password. {remaining_attempts} attempts remaining.'},
                     status=status.HTTP_401_UNAUTHORIZED
                 )
-            lockout_min = getattr(django_settings, 'CREDS_LOCKOUT_MINUTES', 30)
             return Response(
-                {'error': f'Too many failed attempts. Please wait {lockout_min} minutes.'},
+                {'error': f'Too many failed attempts. Please wait {django_settings.CREDS_LOCKOUT_MINUTES} minutes.'},
                 status=status.HTTP_429_TOO_MANY_REQUESTS
             )
         
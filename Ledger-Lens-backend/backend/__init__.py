@@ -1,31 +1,77 @@
 import logging
-import threading
+
+from .celery import app as celery_app
 
 logger = logging.getLogger(__name__)
 
+# Arbitrary app-wide key for the startup-resume advisory lock
+RESUME_LOCK_KEY = 0x4C4C5245
+# Up to this many files are checked with exists() one by one; a listdir (for S3, a paginated LIST of every
+# object in the directory, pdfs/ holding every upload ever made) only pays off beyond that
+STORED_FILE_LISTING_MIN = 20
+
+def stored_file_names(names):
+    """Subset of names present in default storage: an exists() (an os.stat, or an S3 HEAD request) per file for
+    the usual one or two pending uploads, one listdir per directory for more than STORED_FILE_LISTING_MIN"""
+    import posixpath
+    from django.core.files.storage import default_storage
+
+    if len(names) <= STORED_FILE_LISTING_MIN:
+        return {name for name in names if default_storage.exists(name)}
+    present = set()
+    for directory in {posixpath.dirname(name) for name in names}:
+        try:
+            _, files = default_storage.listdir(directory)
+        except FileNotFoundError:  # Local storage: the directory itself is gone
+            continue
+        present.update(posixpath.join(directory, f) if directory else f for f in files)
+    return present.intersection(names)
+
 def resume_incomplete_pdfs():
-    """Resume processing for incomplete PDFs on startup"""
-    from accounts.models import PDFUpload
-    from accounts.views import process_pdf_background
-    
+    """Resume processing for incomplete PDFs on startup (thread mode only)"""
+    from django.conf import settings
+    from django.db import connection, transaction
+    from accounts.models import PDFUpload, PROCESS_STARTED_AT
+    from accounts.views import start_pdf_processing
+
+    if getattr(settings, 'CELERY_BROKER_URL', ''):
+        # acks_late tasks stay on the broker until finished and are redelivered if a worker dies;
+        # re-enqueueing from every web process on boot would only duplicate them
+        logger.info("[STARTUP] Celery broker configured, leaving incomplete PDFs to the worker queue")
+        return
+
     try:
-        incomplete_pdfs = PDFUpload.objects.filter(processed=False, processing_error__isnull=True)
-        count = incomplete_pdfs.count()
-        
-        if count > 0:
-            logger.info(f"[STARTUP] Found {count} incomplete PDF(s), resuming processing...")
-            for pdf_upload in incomplete_pdfs:
-                # Check if PDF file still exists
-                if pdf_upload.file and pdf_upload.file.storage.exists(pdf_upload.file.name):
-                    logger.info(f"[STARTUP] Resuming PDF {pdf_upload.id}")
-                    thread = threading.Thread(target=process_pdf_background, args=(pdf_upload.id,), daemon=True)
-                    thread.start()
-                else:
-                    logger.warning(f"[STARTUP] PDF {pdf_upload.id} file not found, marking as error")
-                    pdf_upload.processing_error = "PDF file not found on restart"
-                    pdf_upload.save()
-        else:
-            logger.info("[STARTUP] No incomplete PDFs found")
+        with transaction.atomic():
+            # One sweep at a time across processes (every gunicorn worker imports wsgi.py without --preload).
+            # Transaction-scoped, since session advisory locks don't survive a transaction-mode pooler.
+            # Duplicates that still slip through are absorbed by the per-job claim (PDFUpload.claim_for_processing).
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", [RESUME_LOCK_KEY])
+                    if not cursor.fetchone()[0]:
+                        logger.info("[STARTUP] Another process is resuming incomplete PDFs, skipping")
+                        return
+
+            incomplete_pdfs = list(
+                PDFUpload.objects.filter(processed=False, processing_error__isnull=True).only('id', 'file')
+            )
+            count = len(incomplete_pdfs)
+
+            if count > 0:
+                logger.info(f"[STARTUP] Found {count} incomplete PDF(s), resuming processing...")
+                existing = stored_file_names([pdf_upload.file.name for pdf_upload in incomplete_pdfs if pdf_upload.file])
+                for pdf_upload in incomplete_pdfs:
+                    # Check if PDF file still exists
+                    if pdf_upload.file and pdf_upload.file.name in existing:
+                        logger.info(f"[STARTUP] Resuming PDF {pdf_upload.id}")
+                        # Jobs claimed before this process started died with the previous process
+                        start_pdf_processing(pdf_upload.id, takeover_before=PROCESS_STARTED_AT)
+                    else:
+                        logger.warning(f"[STARTUP] PDF {pdf_upload.id} file not found, marking as error")
+                        pdf_upload.processing_error = "PDF file not found on restart"
+                        pdf_upload.save(update_fields=['processing_error'])
+            else:
+                logger.info("[STARTUP] No incomplete PDFs found")
     except Exception as e:
         logger.error(f"[STARTUP] Error resuming incomplete PDFs: {str(e)}", exc_info=True)
 
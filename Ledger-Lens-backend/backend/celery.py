@@ -0,0 +1,18 @@
+import gc
+import os
+
+from celery import Celery
+from celery.signals import worker_process_init
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+app = Celery('backend')
+# All Celery options come from Django settings with a CELERY_ prefix
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def freeze_startup_objects(**kwargs):
+    """Keep long-lived worker objects out of gc scans; each PDF job's garbage is collected on its own"""
+    gc.freeze()
@@ -44,6 +44,31 @@ PASSCODE_LOCKOUT_MINUTES = 15
 CREDS_LOCKOUT_MINUTES = 30
 PASSCODE_EXPIRY_DAYS = 7
 
+# Rows per multi-row INSERT when saving extracted transactions; 6 columns x 1000 rows stays well under
+# PostgreSQL's 65535 bind-parameter limit
+TRANSACTION_BATCH_SIZE = int(os.getenv('TRANSACTION_BATCH_SIZE', '1000'))
+
+# Pages per resume checkpoint on object storage (S3 has no append, so each checkpoint rewrites the page-text
+# object); local storage appends and checkpoints every page. A crash re-extracts at most this many pages.
+PAGE_CHECKPOINT_INTERVAL = int(os.getenv('PAGE_CHECKPOINT_INTERVAL', '10'))
+
+# Pages OCR'd concurrently per PDF job. Each runs its own Tesseract process (~100-200 MB with ara+eng), so raise
+# this only on instances with the memory and cores for it.
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '2'))
+
+# Skip OCR on pages whose PDF text layer has at least this many characters and a table header keyword
+# (digitally generated statements). 0 keeps OCR on every page: Arabic statements' text layers use presentation
+# forms, so their field labels are only matched in the OCR text.
+OCR_SKIP_MIN_TEXT_CHARS = int(os.getenv('OCR_SKIP_MIN_TEXT_CHARS', '0'))
+
+# Faster, lower-fidelity OCR: renders at the extractor's fast_render_zoom (1.5x instead of 2x, ~44% fewer
+# pixels), binarizes with one global threshold and uses the fast_config Tesseract options
+OCR_FAST_MODE = os.getenv('OCR_FAST_MODE', 'False').lower() == 'true'
+
+# How long extracted page texts stay in the cache, keyed by PDF content hash, so a re-uploaded statement skips
+# OCR. Opt-in (0 disables): the texts are statement contents; deleting or stopping an upload evicts them.
+EXTRACTED_TEXT_CACHE_SECONDS = int(os.getenv('EXTRACTED_TEXT_CACHE_SECONDS', '0'))
+
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '').split(',') if os.getenv('ALLOWED_HOSTS') else []
 
 
@@ -108,11 +133,28 @@ DATABASES = {
             'connect_timeout': 30,
         },
         # Reuse connections per process; align with pooler docs (e.g. PgBouncer) if needed
-        'CONN_MAX_AGE': 60,
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        # Ping a reused connection before the request uses it, so one dropped by the pooler is replaced
+        # transparently instead of failing the request
+        'CONN_HEALTH_CHECKS': True,
+        # Autocommit per statement for requests (the default, kept explicit): polls must not hold a transaction
+        # (and a pooled server connection) open; write paths use transaction.atomic() where needed
+        'ATOMIC_REQUESTS': False,
+        # Transaction-mode poolers (port 6543) don't keep server-side cursors across transactions; make
+        # QuerySet.iterator() fetch client-side
+        'DISABLE_SERVER_SIDE_CURSORS': True,
     }
 }
 
 
+# Password hashing
+# Argon2id for new passcode hashes; PBKDF2 kept so existing hashes still verify (and are upgraded on next login)
+PASSWORD_HASHERS = [
+    'accounts.hashers.PasscodeArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -209,8 +251,10 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    # Throttle counters live in CACHES['default']; with the DummyCache fallback (no REDIS_URL) they never trip
     'DEFAULT_THROTTLE_RATES': {
         'auth_login_reset': '20/minute',
+        'auth_login': '10/minute',
         'auth_status': '60/minute',
     },
 }
@@ -227,6 +271,10 @@ if REDIS_URL:
             },
         },
     }
+    # Read sessions from Redis so require_authentication doesn't SELECT django_session on every poll;
+    # cached_db still writes through to the DB so logins survive a cache flush
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = 'default'
 else:
     CACHES = {
         'default': {
@@ -234,6 +282,19 @@ else:
         },
     }
 
+# Celery: PDF extraction runs in a dedicated worker (`celery -A backend worker -Q pdf`) only when
+# CELERY_BROKER_URL is set, and that worker must then be deployed too (see README.Docker.md). REDIS_URL alone
+# only enables the cache; without a broker, uploads fall back to an in-process background thread
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', '')
+CELERY_TASK_ROUTES = {
+    'accounts.tasks.process_pdf_task': {'queue': 'pdf'},
+}
+CELERY_TASK_ACKS_LATE = True  # Redeliver if a worker dies mid-PDF; the task resumes from the page checkpoint
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Jobs are long; don't let one worker hoard queued PDFs
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': 2 * 60 * 60,  # Longer than the slowest extraction so acks_late jobs aren't re-sent
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = os.getenv('CORS_ALLOW_ALL_ORIGINS', 'False').lower() == 'true'
 cors_origins = os.getenv('CORS_ALLOWED_ORIGINS', '')
@@ -241,7 +302,10 @@ CORS_ALLOWED_ORIGINS = [origin.strip() for origin in cors_origins.split(',') if
 CORS_ALLOW_CREDENTIALS = True
 
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Always spool uploaded PDFs to a temp file: nothing is buffered in worker memory, and FileSystemStorage
+# moves the temp file into MEDIA_ROOT (file_move_safe) instead of copying it; S3 streams from the temp file
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+FILE_UPLOAD_MAX_MEMORY_SIZE = 0
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
 # Production security settings (for Render/HTTPS)
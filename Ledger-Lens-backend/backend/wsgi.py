@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -22,4 +23,8 @@ try:
 except Exception as e:
     import logging
     logger = logging.getLogger(__name__)
-    logger.error(f"[STARTUP] Failed to resume incomplete PDFs: {str(e)}")
\ No newline at end of file
+    logger.error(f"[STARTUP] Failed to resume incomplete PDFs: {str(e)}")
+
+# Move startup objects (settings, URLconf, imported modules) out of the collector's view so later
+# collections only scan what requests and PDF jobs allocate
+gc.freeze()